@@ -0,0 +1 @@
+default_app_config = 'adfs_provider.apps.ADFSProviderConfig'
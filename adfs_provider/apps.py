@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ADFSProviderConfig(AppConfig):
+    name = 'adfs_provider'
+    verbose_name = 'ADFS'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals
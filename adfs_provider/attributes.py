@@ -0,0 +1,72 @@
+import uuid
+
+# FIXME: put into settings.py
+domain_uuid = uuid.UUID('1c8974a1-1f86-41a0-85dd-94a643370621')
+
+LOWERCASE_ATTRIBUTES = ('department_name', 'email', 'username')
+
+
+def generate_uuid(sid):
+    return uuid.uuid5(domain_uuid, sid).hex
+
+
+class AttributePlan(object):
+    """
+    Attribute mapping compiled into a flat list of transformation steps.
+
+    Calling the plan with a dict of claims returns a new dict with:
+
+    * every claim in `attribute_map` renamed to its output name, and
+      lowercased if the output name is in `lowercase`,
+    * the output attribute `split_name[0]` (a "Last First" full name)
+      replaced by `split_name[1]` (last name) and `split_name[2]`
+      (first names), unless those are already present,
+    * `uuid` derived from the output attribute `uuid_source`.
+
+    With `multivalued`, claim values are lists as in SAML assertions;
+    the first value is used and outputs are wrapped in lists.
+    """
+    def __init__(self, attribute_map, lowercase=LOWERCASE_ATTRIBUTES,
+                 split_name=None, uuid_source=None, multivalued=False):
+        self.renames = tuple(sorted(
+            (in_name, out_name, out_name in lowercase)
+            for in_name, out_name in attribute_map.items()
+        ))
+        self.split_name = split_name
+        self.uuid_source = uuid_source
+        self.multivalued = multivalued
+
+    def __call__(self, claims):
+        attrs = {}
+        multivalued = self.multivalued
+        for in_name, out_name, lowercase in self.renames:
+            val = claims.get(in_name)
+            if multivalued and val:
+                val = val[0]
+            if not val:
+                continue
+            if lowercase:
+                val = val.lower()
+            attrs[out_name] = val
+
+        if self.split_name:
+            source, last_name, first_name = self.split_name
+            full_name = attrs.pop(source, None)
+            if full_name:
+                names = full_name.split(' ')
+                attrs.setdefault(last_name, names[0])
+                attrs.setdefault(first_name, ' '.join(names[1:]))
+
+        sid = attrs.get(self.uuid_source) if self.uuid_source else None
+        if sid:
+            attrs['uuid'] = generate_uuid(sid)
+
+        if multivalued:
+            attrs = {key: [val] for key, val in attrs.items()}
+        return attrs
+
+
+def compile_adfs_plan(attribute_map):
+    return AttributePlan(attribute_map,
+                         split_name=('last_first_name', 'last_name', 'first_name'),
+                         uuid_source='primary_sid')
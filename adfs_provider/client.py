@@ -0,0 +1,111 @@
+"""
+OAuth2 client for the ADFS token endpoint.
+
+allauth's OAuth2Client makes the token request without a timeout, so a
+slow ADFS keeps the worker serving the callback waiting for as long as
+ADFS takes; enough slow callbacks and no worker is left for the rest of
+the site. This client gives the request strict connect and read
+timeouts and sends it through the shared upstream session, which
+reuses connections to ADFS. Requests that fail or time out
+count towards a per-endpoint circuit breaker: after
+ADFS_CIRCUIT_FAILURES consecutive failures, token requests fail
+immediately for ADFS_CIRCUIT_RESET seconds before one is let through to
+try ADFS again.
+"""
+import threading
+import time
+from urllib.parse import parse_qsl
+
+import requests
+from django.conf import settings
+
+from allauth.socialaccount.providers.oauth2.client import OAuth2Client, OAuth2Error
+
+from helsso.http import get_session
+
+
+class CircuitOpen(OAuth2Error):
+    pass
+
+
+class CircuitBreaker(object):
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < settings.ADFS_CIRCUIT_RESET:
+                return False
+            # Let this request try ADFS; the others wait for its result
+            self.opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= settings.ADFS_CIRCUIT_FAILURES:
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    with _breakers_lock:
+        breaker = _breakers.get(url)
+        if breaker is None:
+            breaker = _breakers[url] = CircuitBreaker()
+        return breaker
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+class ADFSOAuth2Client(OAuth2Client):
+    def get_access_token(self, code):
+        breaker = get_breaker(self.access_token_url)
+        if not breaker.allow():
+            raise CircuitOpen('ADFS token endpoint is unavailable')
+
+        data = {
+            'redirect_uri': self.callback_url,
+            'grant_type': 'authorization_code',
+            'code': code,
+            'client_id': self.consumer_key,
+            'client_secret': self.consumer_secret,
+        }
+        self._strip_empty_keys(data)
+        try:
+            resp = get_session().post(
+                self.access_token_url, data=data, headers=self.headers,
+                timeout=(settings.ADFS_TOKEN_CONNECT_TIMEOUT, settings.ADFS_TOKEN_TIMEOUT))
+        except requests.RequestException as e:
+            breaker.failure()
+            raise OAuth2Error('Error retrieving access token: %s' % e)
+        if resp.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+
+        access_token = None
+        if resp.status_code == 200:
+            if (resp.headers.get('content-type', '').split(';')[0] == 'application/json' or
+                    resp.text[:2] == '{"'):
+                access_token = resp.json()
+            else:
+                access_token = dict(parse_qsl(resp.text))
+        if not access_token or 'access_token' not in access_token:
+            raise OAuth2Error('Error retrieving access token: %s' % resp.content)
+        return access_token
@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import threading
+
+from cryptography.hazmat.backends import default_backend
+from cryptography import x509
+
+x509_backend = default_backend()
+
+
+def certificate_fingerprint(certificate):
+    return hashlib.sha256(certificate.encode('ascii')).hexdigest()
+
+
+def load_public_key(certificate):
+    cert_der = base64.b64decode(certificate)
+    x509_cert = x509.load_der_x509_certificate(cert_der, backend=x509_backend)
+    return x509_cert.public_key()
+
+
+class SigningKeyCache(object):
+    """
+    Parsed token signing keys, keyed by realm name.
+
+    Each entry remembers the fingerprint of the certificate it was parsed
+    from, so a changed certificate is noticed and re-parsed even if the
+    invalidation signal was missed.
+    """
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, realm, certificate):
+        fingerprint = certificate_fingerprint(certificate)
+        entry = self._keys.get(realm)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+
+        public_key = load_public_key(certificate)
+        with self._lock:
+            self._keys[realm] = (fingerprint, public_key)
+        return public_key
+
+    def invalidate(self, realm=None):
+        with self._lock:
+            if realm is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(realm, None)
+
+
+signing_keys = SigningKeyCache()
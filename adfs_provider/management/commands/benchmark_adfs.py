@@ -0,0 +1,111 @@
+import json
+import random
+import timeit
+import uuid
+
+import jwt
+
+from django.core.management.base import BaseCommand
+
+from adfs_provider.attributes import compile_adfs_plan, domain_uuid
+from adfs_provider.keys import SigningKeyCache, load_public_key
+from adfs_provider.registry import DEFAULT_ATTRIBUTE_MAP
+from adfs_provider.testing import generate_certificate
+
+
+def generate_claims(count):
+    """Generate claim sets shaped like the ones fs.hel.fi sends."""
+    rnd = random.Random(count)
+    departments = ['KYMP', 'KASKO', 'SOTE', 'KUVA', 'Kanslia']
+    for i in range(count):
+        first, last = 'Etunimi%d' % i, 'Sukunimi%d' % i
+        claims = {
+            'primarysid': 'S-1-5-21-%d-%d' % (rnd.randint(1, 10 ** 9), i),
+            'Company': rnd.choice(departments),
+            'email': '%s.%s@hel.fi' % (first, last),
+            'winaccountname': '%s%s' % (last[:5], first[:2]),
+            'group': ['Grp%d' % rnd.randint(1, 50) for _ in range(rnd.randint(0, 5))],
+            'unique_name': '%s %s' % (last, first),
+        }
+        if rnd.random() < 0.5:
+            claims['given_name'] = first
+            claims['family_name'] = last
+        yield claims
+
+
+def legacy_clean_attributes(attrs_in):
+    """The per-login mapping used before attribute plans, for comparison."""
+    attrs = {}
+    for in_name, out_name in DEFAULT_ATTRIBUTE_MAP.items():
+        val = attrs_in.get(in_name, None)
+        if val is not None:
+            if out_name in ('department_name', 'email', 'username'):
+                val = val.lower()
+            attrs[out_name] = val
+        attrs[out_name] = val
+
+    if 'last_first_name' in attrs:
+        names = attrs['last_first_name'].split(' ')
+        if 'first_name' not in attrs:
+            attrs['first_name'] = [names[0]]
+        if 'last_name' not in attrs:
+            attrs['last_name'] = [' '.join(names[1:])]
+        del attrs['last_first_name']
+
+    attrs['uuid'] = uuid.uuid5(domain_uuid, attrs['primary_sid']).hex
+    return attrs
+
+
+class Command(BaseCommand):
+    help = "Measure the CPU cost of the ADFS login callback"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--corpus', help="JSON file with a list of recorded claim sets")
+
+    def report(self, label, elapsed, iterations):
+        self.stdout.write('%-30s %10.1f us/login' % (label, elapsed / iterations * 1e6))
+
+    def benchmark_signing(self, iterations):
+        certificate, private_pem = generate_certificate()
+        token = jwt.encode({'unique_name': 'Meikäläinen Matti'}, private_pem, algorithm='RS256')
+        options = {'verify_aud': False}
+
+        def uncached():
+            key = load_public_key(certificate)
+            jwt.decode(token, key=key, options=options)
+
+        cache = SigningKeyCache()
+
+        def cached():
+            key = cache.get('helsinki', certificate)
+            jwt.decode(token, key=key, options=options)
+
+        self.stdout.write('Token signature verification (%d iterations)' % iterations)
+        self.report('certificate parsed per login', timeit.timeit(uncached, number=iterations), iterations)
+        self.report('cached signing key', timeit.timeit(cached, number=iterations), iterations)
+
+    def benchmark_attributes(self, corpus, iterations):
+        plan = compile_adfs_plan(DEFAULT_ATTRIBUTE_MAP)
+        rounds = max(1, iterations // len(corpus))
+        count = rounds * len(corpus)
+
+        def run(transform):
+            for claims in corpus:
+                transform(claims)
+
+        self.stdout.write('Claim transformation (%d claim sets, %d logins)' % (len(corpus), count))
+        self.report('legacy clean_attributes', timeit.timeit(lambda: run(legacy_clean_attributes), number=rounds),
+                    count)
+        self.report('compiled attribute plan', timeit.timeit(lambda: run(plan), number=rounds), count)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if options['corpus']:
+            with open(options['corpus']) as f:
+                corpus = json.load(f)
+        else:
+            corpus = list(generate_claims(100))
+
+        self.benchmark_signing(iterations)
+        self.benchmark_attributes(corpus, iterations * 10)
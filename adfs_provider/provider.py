@@ -30,9 +30,9 @@ class ADFSProvider(OAuth2Provider):
             realm = 'helsinki'
             #return super(ADFSProvider, self).get_app(request)
 
-        from allauth.socialaccount.models import SocialApp
+        from .registry import adfs_realms
 
-        return SocialApp.objects.get(name=realm, provider=self.id)
+        return adfs_realms.get(realm).app
 
     def extract_uid(self, data):
         return data['uuid']
@@ -0,0 +1,90 @@
+import logging
+
+from allauth.socialaccount.models import SocialApp
+
+from helsso.registry import Registry
+
+from .attributes import compile_adfs_plan
+from .keys import signing_keys
+from .models import ADFSRealm
+
+logger = logging.getLogger(__name__)
+
+# Defaults for ADFS apps that have no ADFSRealm configured.
+# FIXME: Move into ADFSRealm rows
+DEFAULT_ADFS_URL = 'https://fs.hel.fi/adfs'
+DEFAULT_CERTIFICATE = 'MIIDMDCCAhigAwIBAgIBATANBgkqhkiG9w0BAQsFADAjMSEwHwYDVQQDExhBREZTIFNpZ25pbmcgLSBmcy5oZWwuZmkwHhcNMTYwNDAzMjIxMTAwWhcNMjEwNDAzMjIxMTAwWjAjMSEwHwYDVQQDExhBREZTIFNpZ25pbmcgLSBmcy5oZWwuZmkwggEiMA0GCSqGSIb3DQEBAQUAA4IBDwAwggEKAoIBAQCrCo9kuzljk4F8R12AeIYMARztxkMojcrN1KN3KQeoxcCPaFOTMYHWk8ww1N+m0PJoLl1Eray+cMsoHrdd3iVxmApcQBxD02SnGsEn/3D/sTHcoi9WzqwM8ESbtm0jGIvfWrpJtMO/g7ELW0dXBcWq4LRvBtyTt3jiehIO0HohS8xfQ4+vURFpjvfD0kjPemsMJ7QB8Eo+JscSMTF2CNFO9vct1IJiQJUfRbVWk8I/JFA65ZuXrCjY//LSNLzLRZ+Iw1BliSj4jbmOtG8mcb7Fql7dvvz91AMksguO4+9xATukZK7MBLb3DtT2FzYt9oUBRwSsMXiNXh8AitTLUMgpAgMBAAGjbzBtMAwGA1UdEwEB/wQCMAAwHQYDVR0OBBYEFBDL4FpHu+kQEI7MIpSjSACaA9ajMAsGA1UdDwQEAwIFIDARBglghkgBhvhCAQEEBAMCBkAwHgYJYIZIAYb4QgENBBEWD3hjYSBjZXJ0aWZpY2F0ZTANBgkqhkiG9w0BAQsFAAOCAQEAISn44oOdtfdMHh0Z4nezAuDHtKqTd6iV3MY7MwTFmiUFQhJADO2ezpoW3Xj64wWeg3eVXyC7iHk/SV5OVmmo4uU/1YJHiBc5jEUZ5EdvaZQaDH5iaJlK6aiCTznqwu7XJS7LbLeLrVqj3H3IYsV6BiGlT4Z1rXYX+nDfi46TJCKqxE0zTArQQROocfKS+7JM+JU5dLMNOOC+6tCUOP3GEjuE3PMetpbH+k6Wu6d3LzhpU2QICWJnFpj1yJTAb94pWRUKNoBhpxQlWvNzRgFgJesIfkZ4CqqhmHqnV/BO+7MMv/g+WXRD09fo/YIXozpWzmO9LBzEvFe7Itz6C1R4Ng=='
+DEFAULT_ATTRIBUTE_MAP = {
+    'primarysid': 'primary_sid',
+    'Company': 'department_name',
+    'email': 'email',
+    'winaccountname': 'username',
+    'group': 'ad_groups',
+    'unique_name': 'last_first_name',
+    'given_name': 'first_name',
+    'family_name': 'last_name',
+}
+
+
+class RealmConfig(object):
+    def __init__(self, app, realm=None):
+        self.app = app
+        self.name = app.name
+        adfs_url = DEFAULT_ADFS_URL
+        certificate = DEFAULT_CERTIFICATE
+        attribute_map = DEFAULT_ATTRIBUTE_MAP
+        if realm is not None:
+            self.name = realm.name
+            adfs_url = realm.adfs_url.rstrip('/')
+            if realm.certificate:
+                certificate = realm.certificate
+            mappings = realm.attribute_mappings.all()
+            if mappings:
+                attribute_map = {m.in_name: m.out_name for m in mappings}
+
+        self.adfs_url = adfs_url
+        self.authorize_url = adfs_url + '/oauth2/authorize'
+        self.access_token_url = adfs_url + '/oauth2/token'
+        self.attribute_map = attribute_map
+        self.attribute_plan = compile_adfs_plan(attribute_map)
+        self.signing_key = signing_keys.get(self.name, certificate)
+
+
+class RealmRegistry(Registry):
+    """
+    Configuration of every ADFS realm, keyed by realm name.
+
+    Apps without an ADFSRealm are served under the SocialApp name with
+    the fs.hel.fi defaults. Realms whose certificate cannot be parsed
+    are left out.
+    """
+    def load(self):
+        apps = SocialApp.objects.filter(provider='adfs')\
+            .select_related('adfsrealm')\
+            .prefetch_related('adfsrealm__attribute_mappings')
+        realms = {}
+        for app in apps:
+            try:
+                realm = app.adfsrealm
+            except ADFSRealm.DoesNotExist:
+                realm = None
+            try:
+                config = RealmConfig(app, realm)
+            except ValueError:
+                # A broken certificate only disables its own realm
+                logger.exception("Invalid configuration for ADFS app %s", app.name)
+                continue
+            realms[config.name] = config
+        return realms
+
+    def get(self, name):
+        try:
+            return self.get_data()[name]
+        except KeyError:
+            raise SocialApp.DoesNotExist("ADFS realm '%s' not found" % name)
+
+    def __contains__(self, name):
+        return name in self.get_data()
+
+
+adfs_realms = RealmRegistry('adfs_realms')
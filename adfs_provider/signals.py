@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from allauth.socialaccount.models import SocialApp
+
+from .keys import signing_keys
+from .models import ADFSRealm, ADFSAttributeMapping
+from .registry import adfs_realms
+
+
+@receiver(post_save, sender=ADFSRealm)
+@receiver(post_delete, sender=ADFSRealm)
+def invalidate_signing_key(sender, instance, **kwargs):
+    # Invalidate everything, as the realm may also have been renamed
+    signing_keys.invalidate()
+
+
+for model in (SocialApp, ADFSRealm, ADFSAttributeMapping):
+    post_save.connect(adfs_realms.invalidate, sender=model,
+                      dispatch_uid='adfs_realms_%s_save' % model.__name__)
+    post_delete.connect(adfs_realms.invalidate, sender=model,
+                        dispatch_uid='adfs_realms_%s_delete' % model.__name__)
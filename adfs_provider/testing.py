@@ -0,0 +1,97 @@
+"""
+Helpers for exercising the ADFS login flow without a real ADFS server.
+"""
+import base64
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from .keys import x509_backend
+
+
+def generate_certificate():
+    """Generate a throwaway self-signed signing certificate and its key."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                   backend=x509_backend)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'ADFS Signing - test')])
+    now = datetime.datetime.utcnow()
+    builder = x509.CertificateBuilder()\
+        .subject_name(name)\
+        .issuer_name(name)\
+        .public_key(key.public_key())\
+        .serial_number(1)\
+        .not_valid_before(now)\
+        .not_valid_after(now + datetime.timedelta(days=1))
+    x509_cert = builder.sign(key, hashes.SHA256(), x509_backend)
+    certificate = base64.b64encode(x509_cert.public_bytes(serialization.Encoding.DER)).decode('ascii')
+    private_pem = key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    return certificate, private_pem
+
+
+class FakeADFSServer(object):
+    """
+    Local stand-in for the ADFS OAuth2 token endpoint.
+
+    Every token request is answered with an access token carrying the
+    claims returned by `get_claims()`, signed with a generated key. Use
+    `adfs_url` and `certificate` to configure an ADFSRealm. Responses
+    are delayed by `delay` seconds.
+    """
+    def __init__(self, get_claims, delay=0):
+        self.get_claims = get_claims
+        self.delay = delay
+        self.certificate, self.private_pem = generate_certificate()
+        self.requests = 0
+        self.httpd = HTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.adfs_url = 'http://127.0.0.1:%d/adfs' % self.httpd.server_port
+        self.thread = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                server.requests += 1
+                time.sleep(server.delay)
+                if self.path != '/adfs/oauth2/token':
+                    self.send_error(404)
+                    return
+                token = jwt.encode(server.get_claims(), server.private_pem, algorithm='RS256')
+                body = json.dumps({
+                    'access_token': token.decode('ascii'),
+                    'token_type': 'bearer',
+                    'expires_in': 3600,
+                }).encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
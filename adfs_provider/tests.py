@@ -1,39 +1,104 @@
-from allauth.socialaccount.tests import create_oauth2_tests
-from allauth.tests import MockedResponse
-from allauth.socialaccount.providers import registry
-
-from .provider import GitHubProvider
-
-class GitHubTests(create_oauth2_tests(registry.by_id(GitHubProvider.id))):
-    def get_mocked_response(self):
-        return MockedResponse(200, """
-        {
-            "type":"User",
-            "organizations_url":"https://api.github.com/users/pennersr/orgs",
-            "gists_url":"https://api.github.com/users/pennersr/gists{/gist_id}",
-            "received_events_url":"https://api.github.com/users/pennersr/received_events",
-            "gravatar_id":"8639768262b8484f6a3380f8db2efa5b",
-            "followers":16,
-            "blog":"http://www.intenct.info",
-            "avatar_url":"https://secure.gravatar.com/avatar/8639768262b8484f6a3380f8db2efa5b?d=https://a248.e.akamai.net/assets.github.com%2Fimages%2Fgravatars%2Fgravatar-user-420.png",
-            "login":"pennersr",
-            "created_at":"2010-02-10T12:50:51Z",
-            "company":"IntenCT",
-            "subscriptions_url":"https://api.github.com/users/pennersr/subscriptions",
-            "public_repos":14,
-            "hireable":false,
-            "url":"https://api.github.com/users/pennersr",
-            "public_gists":0,
-            "starred_url":"https://api.github.com/users/pennersr/starred{/owner}{/repo}",
-            "html_url":"https://github.com/pennersr",
-            "location":"The Netherlands",
-            "bio":null,
-            "name":"Raymond Penners",
-            "repos_url":"https://api.github.com/users/pennersr/repos",
-            "followers_url":"https://api.github.com/users/pennersr/followers",
-            "id":201022,
-            "following":0,
-            "email":"raymond.penners@intenct.nl",
-            "events_url":"https://api.github.com/users/pennersr/events{/privacy}",
-            "following_url":"https://api.github.com/users/pennersr/following"
-        }""")
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from allauth.socialaccount.models import SocialApp
+from helsso.http import upstream_duration
+from users.testing import ADFSRealmMixin
+
+from .attributes import compile_adfs_plan, generate_uuid
+from .keys import SigningKeyCache, load_public_key
+from .models import ADFSRealm
+from .registry import DEFAULT_ATTRIBUTE_MAP
+from .testing import generate_certificate
+
+
+class AttributePlanTests(TestCase):
+    def test_default_mapping(self):
+        plan = compile_adfs_plan(DEFAULT_ATTRIBUTE_MAP)
+        attrs = plan({
+            'primarysid': 'S-1-5-21-1',
+            'Company': 'KYMP',
+            'email': 'Matti.Meikalainen@hel.fi',
+            'winaccountname': 'MeikaMa',
+            'unique_name': 'Meikäläinen Matti Johannes',
+        })
+        self.assertEqual(attrs, {
+            'primary_sid': 'S-1-5-21-1',
+            'department_name': 'kymp',
+            'email': 'matti.meikalainen@hel.fi',
+            'username': 'meikama',
+            'last_name': 'Meikäläinen',
+            'first_name': 'Matti Johannes',
+            'uuid': generate_uuid('S-1-5-21-1'),
+        })
+
+    def test_explicit_names_win(self):
+        plan = compile_adfs_plan(DEFAULT_ATTRIBUTE_MAP)
+        attrs = plan({'unique_name': 'A B', 'given_name': 'First', 'family_name': 'Last'})
+        self.assertEqual((attrs['first_name'], attrs['last_name']), ('First', 'Last'))
+
+
+class SigningKeyCacheTests(TestCase):
+    def test_parsed_once_per_certificate(self):
+        keys = SigningKeyCache()
+        first, second = generate_certificate()[0], generate_certificate()[0]
+        key = keys.get('realm', first)
+        self.assertIs(keys.get('realm', first), key)
+        # Realms are cached separately
+        self.assertIsNot(keys.get('other', first), key)
+
+        # A changed certificate is parsed even without an invalidation
+        changed = keys.get('realm', second)
+        self.assertEqual(changed.public_numbers(), load_public_key(second).public_numbers())
+        self.assertIs(keys.get('realm', second), changed)
+
+        keys.invalidate('realm')
+        self.assertIsNot(keys.get('realm', second), changed)
+
+
+class ADFSLoginTests(ADFSRealmMixin, TestCase):
+    def test_callback_creates_user(self):
+        response = self.adfs.login(self.client, 'x')()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.adfs.server.requests, 1)
+
+        user = get_user_model().objects.get(email='adfs-x@bench.invalid')
+        self.assertEqual(user.uuid.hex, generate_uuid('S-1-5-21-bench-x'))
+        self.assertEqual(user.department_name, 'bench')
+        self.assertEqual(user.socialaccount_set.get().provider, 'adfs')
+        self.assertIn('helsso_upstream_request_duration_seconds_count{host="127.0.0.1",status="2xx"}',
+                      dict(upstream_duration.samples()))
+
+    def test_unknown_realm(self):
+        response = self.client.get('/accounts/adfs/nonexistent/login/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_broken_realm(self):
+        app = SocialApp.objects.create(provider='adfs', name='broken', client_id='broken', secret='x')
+        ADFSRealm.objects.create(app=app, name='broken', adfs_url='https://broken.invalid/adfs',
+                                 certificate='not a certificate')
+        self.assertEqual(self.client.get('/accounts/adfs/broken/login/').status_code, 404)
+        response = self.adfs.login(self.client, 'x')()
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(ADFS_TOKEN_TIMEOUT=0.1, ADFS_CIRCUIT_FAILURES=2, ADFS_CIRCUIT_RESET=60)
+class ADFSTimeoutTests(ADFSRealmMixin, TestCase):
+    def setUp(self):
+        super(ADFSTimeoutTests, self).setUp()
+        self.adfs.server.delay = 0.3
+
+    def test_circuit_opens_after_timeouts(self):
+        for i in range(2):
+            response = self.adfs.login(self.client, 'x')()
+            self.assertTemplateUsed(response, 'socialaccount/authentication_error.html')
+
+        start = time.monotonic()
+        response = self.adfs.login(self.client, 'x')()
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertTemplateUsed(response, 'socialaccount/authentication_error.html')
+        time.sleep(0.5)
+        self.assertEqual(self.adfs.server.requests, 2)
+        self.assertFalse(get_user_model().objects.filter(email='adfs-x@bench.invalid').exists())
@@ -1,14 +1,25 @@
 import logging
-import jwt
-import datetime
 
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework import permissions, serializers, generics, mixins, views
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import permissions, renderers, serializers, generics, mixins, views
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import APIException, NotFound, ParseError, PermissionDenied
 from oauth2_provider.ext.rest_framework import TokenHasReadWriteScope
-from oauth2_provider.models import get_application_model
-from hkijwt.models import AppToAppPermission
+from hkijwt import cache as jwt_cache
+from hkijwt.claims import user_claims
+from hkijwt.graph import app_permissions
+from hkijwt.keys import sign_jwt
+from hkijwt.models import SigningKey
+from users import changes, listing
+from users.models import Application
+from users.authentication import ClientCredentialsAuthentication, lookup_tokens
+
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +39,14 @@ class UserSerializer(serializers.ModelSerializer):
         model = get_user_model()
 
 
+class TimedAuthenticationMixin(object):
+    def perform_authentication(self, request):
+        with metrics.phase('oauth2'):
+            super(TimedAuthenticationMixin, self).perform_authentication(request)
+
+
 # ViewSets define the view behavior.
-class UserView(generics.RetrieveAPIView,
+class UserView(TimedAuthenticationMixin, generics.RetrieveAPIView,
                mixins.RetrieveModelMixin):
     def get_queryset(self):
         user = self.request.user
@@ -52,41 +69,316 @@ class UserView(generics.RetrieveAPIView,
     serializer_class = UserSerializer
 
 
-class GetJWTView(views.APIView):
+class IsSuperuser(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_superuser
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode('utf8') + b'\n'
+
+
+class UserListView(TimedAuthenticationMixin, views.APIView):
+    """
+    List users for directory synchronization; superusers only.
+
+    Query parameters:
+    - `order_by`: `uuid` (default) or `date_joined`
+    - `cursor`: the `next` cursor of the previous page
+    - `limit`: page size, at most `max_limit`
+    - `updated_since`: only users modified at or after this ISO 8601 time
+    - `fields`: comma-separated fields to include
+
+    With `format=ndjson` or `Accept: application/x-ndjson`, all the
+    matching users after `cursor` are streamed as newline-delimited JSON
+    instead of a single page.
+    """
+    permission_classes = [permissions.IsAuthenticated, TokenHasReadWriteScope, IsSuperuser]
+    renderer_classes = views.APIView.renderer_classes + [NDJSONRenderer]
+    default_limit = 100
+    max_limit = 1000
+
+    def get_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return listing.DEFAULT_FIELDS
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(fields) - set(listing.FIELDS)
+        if unknown:
+            raise ParseError("unknown fields: %s" % ', '.join(sorted(unknown)))
+        return fields
+
+    def get_queryset(self):
+        queryset = get_user_model().objects.all()
+        updated_since = self.request.query_params.get('updated_since')
+        if updated_since:
+            try:
+                updated_since = parse_datetime(updated_since)
+            except ValueError:
+                updated_since = None
+            if updated_since is None:
+                raise ParseError("updated_since must be an ISO 8601 datetime")
+            queryset = queryset.filter(modified_at__gte=updated_since)
+        return queryset
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ParseError("limit must be an integer")
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request, format=None):
+        params = request.query_params
+        ordering = params.get('order_by', 'uuid')
+        if ordering not in listing.ORDERINGS:
+            raise ParseError("order_by must be one of: %s" % ', '.join(sorted(listing.ORDERINGS)))
+        fields = self.get_fields()
+        queryset = self.get_queryset()
+        cursor = params.get('cursor') or None
+
+        try:
+            if request.accepted_renderer.format == 'ndjson':
+                # Check the cursor before the response starts
+                if cursor is not None:
+                    listing.decode_cursor(cursor, ordering)
+                rows = listing.iter_rows(queryset, fields, ordering, cursor, self.max_limit)
+                return StreamingHttpResponse(
+                    (json.dumps(row) + '\n' for row in rows), content_type='application/x-ndjson')
+            rows, next_cursor = listing.get_page(queryset, fields, ordering, cursor, self.get_limit())
+        except listing.InvalidCursor as e:
+            raise ParseError(str(e))
+
+        next_url = None
+        if next_cursor is not None:
+            query = params.copy()
+            query['cursor'] = next_cursor
+            next_url = request.build_absolute_uri('?' + query.urlencode())
+        return Response(dict(results=rows, next=next_url))
+
+
+class UserChangeFeedView(TimedAuthenticationMixin, views.APIView):
+    """
+    Changes to users after sequence number `since`; superusers only.
+
+    Each changed user is listed once with its current state, or as
+    `deleted`. Pass the returned `last_seq` as `since` of the next call;
+    `more` tells if there may be more changes waiting.
+    """
+    permission_classes = [permissions.IsAuthenticated, TokenHasReadWriteScope, IsSuperuser]
+    max_limit = 1000
+
+    def get(self, request, format=None):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', self.max_limit))
+        except ValueError:
+            raise ParseError("since and limit must be integers")
+        limit = max(1, min(limit, self.max_limit))
+        results, last_seq, more = changes.get_changes(since, limit)
+        return Response(dict(changes=results, last_seq=last_seq, more=more))
+
+
+class SigningUnavailable(APIException):
+    status_code = 503
+    default_detail = "No JWT signing key is available."
+
+
+def encode_jwt(user, target_app, expires):
+    payload = user_claims(user)
+    payload['iss'] = settings.JWT_ISSUER
+    payload['aud'] = target_app.client_id
+    payload['exp'] = expires
+    with metrics.phase('crypto'):
+        try:
+            return sign_jwt(payload, target_app.client_secret)
+        except SigningKey.DoesNotExist as e:
+            logger.error("Cannot sign JWT: %s", e)
+            raise SigningUnavailable()
+
+
+class GetJWTView(TimedAuthenticationMixin, views.APIView):
     permission_classes = [permissions.IsAuthenticated, TokenHasReadWriteScope]
 
     def get(self, request, format=None):
         requester_app = request.auth.application
         target_app = request.query_params.get('target_app', '').strip()
+        user = request.user
+        expires = request.auth.expires
+        if target_app == requester_app.client_id:
+            # An app never needs a permission to call itself
+            target_app = ''
+
+        # The cache key covers the app permissions, so on a hit the
+        # permission check below has already been done.
+        cache_key, encoded = jwt_cache.get_token(
+            request.auth.token, target_app or requester_app.client_id, user.pk)
+        if encoded is not None:
+            return Response(dict(token=encoded, expires_at=expires))
+
         if target_app:
-            qs = get_application_model().objects.all()
-            target_app = generics.get_object_or_404(qs, client_id=target_app)
-            try:
-                perm = AppToAppPermission.objects.get(requester=requester_app,
-                                                      target=target_app)
-            except AppToAppPermission.DoesNotExist:
+            client_id = target_app
+            target_app = app_permissions.get_app(client_id)
+            if target_app is None:
+                raise NotFound("app %s not found" % client_id)
+            if not app_permissions.has_permission(requester_app.pk, client_id):
                 raise PermissionDenied("no permissions for app %s" % target_app)
         else:
             target_app = requester_app
 
-        secret = target_app.client_secret
+        encoded = encode_jwt(user, target_app, expires)
+        jwt_cache.set_token(cache_key, encoded, expires)
+
+        ret = dict(token=encoded, expires_at=expires)
+        return Response(ret)
+
+
+class GetJWTBatchView(TimedAuthenticationMixin, views.APIView):
+    """
+    Issue JWTs for several target apps at once.
+
+    Target client ids are given as repeated or comma-separated
+    `target_app` query parameters. Apps that do not exist or that the
+    requesting app has no permission for are reported in `errors`.
+    """
+    permission_classes = [permissions.IsAuthenticated, TokenHasReadWriteScope]
+    max_targets = 50
+
+    def get_target_ids(self):
+        target_ids = []
+        for param in self.request.query_params.getlist('target_app'):
+            for client_id in param.split(','):
+                client_id = client_id.strip()
+                if client_id and client_id not in target_ids:
+                    target_ids.append(client_id)
+        if not target_ids:
+            raise ParseError("target_app is required")
+        if len(target_ids) > self.max_targets:
+            raise ParseError("at most %d target apps allowed" % self.max_targets)
+        return target_ids
+
+    def get(self, request, format=None):
+        requester_app = request.auth.application
         user = request.user
+        expires = request.auth.expires
 
-        payload = UserSerializer(user).data
-        delete_fields = ['last_login', 'date_joined', 'uuid']
-        for field in delete_fields:
-            if field in payload:
-                del payload[field]
+        tokens = {}
+        errors = {}
+        cache_keys = {}
+        for client_id in self.get_target_ids():
+            cache_keys[client_id], encoded = jwt_cache.get_token(
+                request.auth.token, client_id, user.pk)
+            if encoded is not None:
+                tokens[client_id] = encoded
 
-        payload['iss'] = 'https://api.hel.fi/sso'  # FIXME: Make configurable
-        payload['sub'] = str(user.uuid)
-        payload['aud'] = target_app.client_id
-        payload['exp'] = request.auth.expires
-        encoded = jwt.encode(payload, secret, algorithm='HS256')
+        for client_id, cache_key in cache_keys.items():
+            if client_id in tokens:
+                continue
+            target_app = app_permissions.get_app(client_id)
+            if target_app is None:
+                errors[client_id] = "app not found"
+            # As in GetJWTView, an app never needs a permission to call itself
+            elif (client_id != requester_app.client_id and
+                    not app_permissions.has_permission(requester_app.pk, client_id)):
+                errors[client_id] = "no permissions for app %s" % target_app
+            else:
+                encoded = encode_jwt(user, target_app, expires)
+                jwt_cache.set_token(cache_key, encoded, expires)
+                tokens[client_id] = encoded
 
-        ret = dict(token=encoded, expires_at=request.auth.expires)
+        ret = dict(tokens=tokens, expires_at=expires)
+        if errors:
+            ret['errors'] = errors
         return Response(ret)
 
 
+class IsOAuth2Client(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return isinstance(request.auth, Application)
+
+
+def introspect(entry, client):
+    """
+    Return the RFC 7662 introspection response for a token lookup result.
+
+    `client` may only introspect tokens issued to itself or to
+    applications that have app-to-app permission to call it; other
+    tokens are reported inactive, as are tokens that are not issued for
+    a user (client credentials grant), since introspection describes
+    the user a token acts for.
+    """
+    if entry is None:
+        return {'active': False}
+    access_token, user = entry
+    if (access_token.application_id != client.pk and
+            not app_permissions.has_permission(access_token.application_id, client.client_id)):
+        return {'active': False}
+    return {
+        'active': True,
+        'scope': access_token.scope,
+        'client_id': access_token.client_id,
+        'username': user.get_username(),
+        'sub': str(user.uuid),
+        'exp': int(access_token.expires.timestamp()),
+        'token_type': 'Bearer',
+    }
+
+
+class IntrospectTokenView(views.APIView):
+    """
+    Token introspection (RFC 7662) for resource servers.
+
+    The caller authenticates with its OAuth2 client credentials and
+    posts the token in the `token` form field.
+    """
+    authentication_classes = [ClientCredentialsAuthentication]
+    permission_classes = [IsOAuth2Client]
+
+    def post(self, request, format=None):
+        token = request.data.get('token')
+        if not token:
+            raise ParseError("token is required")
+        if not isinstance(token, str):
+            raise ParseError("token must be a string")
+        return Response(introspect(lookup_tokens([token]).get(token), request.auth))
+
+
+class IntrospectTokensView(views.APIView):
+    """
+    Introspect several tokens at once.
+
+    Tokens are given as repeated `token` form fields or as a JSON list
+    in `tokens`. The response lists the introspection results in the
+    same order.
+    """
+    authentication_classes = [ClientCredentialsAuthentication]
+    permission_classes = [IsOAuth2Client]
+    max_tokens = 100
+
+    def get_tokens(self):
+        data = self.request.data
+        if hasattr(data, 'getlist'):
+            tokens = data.getlist('token')
+        else:
+            tokens = data.get('tokens')
+        if not isinstance(tokens, list) or not tokens:
+            raise ParseError("tokens are required")
+        if len(tokens) > self.max_tokens:
+            raise ParseError("at most %d tokens allowed" % self.max_tokens)
+        if not all(isinstance(token, str) for token in tokens):
+            raise ParseError("tokens must be strings")
+        return tokens
+
+    def post(self, request, format=None):
+        tokens = self.get_tokens()
+        found = lookup_tokens(tokens)
+        return Response(dict(tokens=[introspect(found.get(token), request.auth) for token in tokens]))
+
+
 #router = routers.DefaultRouter()
 #router.register(r'users', UserViewSet)
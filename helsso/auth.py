@@ -1,30 +1,25 @@
-import hashlib
-import uuid
 import logging
 from djangosaml2.backends import Saml2Backend
 
+from adfs_provider.attributes import AttributePlan
+
 logger = logging.getLogger(__name__)
 
-# FIXME: put into settings.py
-domain_uuid = uuid.UUID('1c8974a1-1f86-41a0-85dd-94a643370621')
+LOWERCASE_ATTRIBUTES = ('organizationName', 'emailAddress', 'windowsAccountName')
+
+saml_attribute_plan = AttributePlan(
+    {attr: attr for attr in LOWERCASE_ATTRIBUTES + ('displayName', 'primarySID')},
+    lowercase=LOWERCASE_ATTRIBUTES,
+    split_name=('displayName', 'lastName', 'firstName'),
+    uuid_source='primarySID',
+    multivalued=True,
+)
 
 
 class HelsinkiBackend(Saml2Backend):
     def _clean_attributes(self, session_info):
         attrs = session_info['ava']
-        for attr in ('organizationName', 'emailAddress',
-                     'windowsAccountName'):
-            if attr not in attrs:
-                continue
-            attrs[attr][0] = attrs[attr][0].lower()
-        if 'displayName' in attrs:
-            names = attrs['displayName'][0].split(' ')
-            attrs['lastName'] = [names[0]]
-            attrs['firstName'] = [' '.join(names[1:])]
-
-        if 'primarySID' in attrs:
-            user_uuid = uuid.uuid5(domain_uuid, attrs['primarySID'][0]).hex
-            attrs['uuid'] = [user_uuid]
+        attrs.update(saml_attribute_plan(attrs))
 
     def authenticate(self, session_info=None, attribute_mapping=None,
                      create_unknown_user=True):
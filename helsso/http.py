@@ -0,0 +1,118 @@
+"""
+Shared HTTP session for requests to upstream identity providers.
+
+All token exchanges and profile fetches go through one process-wide
+requests session, so TLS connections to each provider are kept alive
+and reused across logins instead of being set up for every request.
+The session has connection pools of UPSTREAM_HTTP_POOL_MAXSIZE
+connections for up to UPSTREAM_HTTP_POOL_CONNECTIONS hosts, default
+timeouts, and retries of failed connection attempts. Requests that
+may have reached the provider are not retried; authorization codes
+can be used only once. Cookies are never stored, as the session is
+shared by all users.
+
+The time every request takes is recorded per upstream host in the
+`helsso_upstream_request_duration_seconds` histogram.
+
+allauth's providers call `requests` directly; with
+UPSTREAM_HTTP_PATCH_ALLAUTH set, `patch_allauth()` points the
+`requests` name of their modules at the shared session.
+"""
+import importlib
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from . import metrics
+
+upstream_duration = metrics.histogram(
+    'helsso_upstream_request_duration_seconds',
+    "Time spent on requests to upstream identity providers", ('host', 'status'))
+
+
+def _status_label(response):
+    if response is None:
+        return 'error'
+    return '%dxx' % (response.status_code // 100)
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """HTTPAdapter with default timeouts that records request durations."""
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = (settings.UPSTREAM_HTTP_CONNECT_TIMEOUT, settings.UPSTREAM_HTTP_TIMEOUT)
+        response = None
+        start = time.perf_counter()
+        try:
+            with metrics.phase('upstream'):
+                response = super(UpstreamAdapter, self).send(request, **kwargs)
+            return response
+        finally:
+            upstream_duration.observe(time.perf_counter() - start,
+                                      host=urlparse(request.url).hostname,
+                                      status=_status_label(response))
+
+
+def create_session():
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    retries = Retry(total=settings.UPSTREAM_HTTP_RETRIES, read=0,
+                    status_forcelist=(502, 503, 504), backoff_factor=0.1,
+                    raise_on_status=False)
+    adapter = UpstreamAdapter(pool_connections=settings.UPSTREAM_HTTP_POOL_CONNECTIONS,
+                              pool_maxsize=settings.UPSTREAM_HTTP_POOL_MAXSIZE,
+                              max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+class RequestsProxy(object):
+    """Stands in for the `requests` module, sending through the shared session."""
+    def request(self, method, url, **kwargs):
+        return get_session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def __getattr__(self, name):
+        # Exceptions, auth classes and the like
+        return getattr(requests, name)
+
+
+def patch_allauth():
+    """Send the requests of allauth's OAuth2 client and providers through the shared session."""
+    from allauth.socialaccount import providers
+
+    modules = ['allauth.socialaccount.providers.oauth2.client']
+    modules += [type(provider).__module__.rsplit('.', 1)[0] + '.views'
+                for provider in providers.registry.get_list()]
+    proxy = RequestsProxy()
+    for name in modules:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if getattr(module, 'requests', None) is requests:
+            module.requests = proxy
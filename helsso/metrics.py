@@ -0,0 +1,239 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters can be used from anywhere. Request timings are collected by
+`MetricsMiddleware`, which must be added to MIDDLEWARE_CLASSES; code can
+attribute time to a phase of the current request with `phase()`.
+"""
+import bisect
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+
+_metrics = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(val).replace('"', '\\"'))
+                             for key, val in labels)
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(entry[0]), entry[1], entry[2])
+                            for key, entry in self._values.items())
+        for key, bucket_counts, total, count in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = itertools.accumulate(bucket_counts)
+            for bound, bucket_count in zip(self.buckets, cumulative):
+                yield ('%s_bucket%s' % (self.name, _format_labels(labels + [('le', bound)])),
+                       bucket_count)
+            yield '%s_bucket%s' % (self.name, _format_labels(labels + [('le', '+Inf')])), count
+            yield '%s_sum%s' % (self.name, _format_labels(labels)), total
+            yield '%s_count%s' % (self.name, _format_labels(labels)), count
+
+
+def register(metric):
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name, help_text):
+    return register(Counter(name, help_text))
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return register(Histogram(name, help_text, labelnames, buckets))
+
+
+def render():
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.append('# HELP %s %s' % (metric.name, metric.help_text))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+        for name, value in metric.samples():
+            lines.append('%s %s' % (name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def is_metrics_client(request):
+    """Whether `request` may read the metrics; see METRICS_ALLOWED_IPS and METRICS_TOKEN."""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    return bool(token and len(auth) == 2 and auth[0].lower() == 'bearer' and
+                constant_time_compare(auth[1], token))
+
+
+def metrics_view(request):
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4')
+
+
+request_duration = histogram(
+    'helsso_request_duration_seconds', "Time spent handling requests", ('endpoint',))
+phase_duration = histogram(
+    'helsso_request_phase_duration_seconds',
+    "Time spent in a phase of handling a request; phases may overlap", ('endpoint', 'phase'))
+request_queries = histogram(
+    'helsso_request_queries', "Database queries per request", ('endpoint',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to `name` in the current request."""
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0) + time.perf_counter() - start
+
+
+class QueryCountingMixin(object):
+    """Counts the queries of the current request and the time they take."""
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return super(QueryCountingMixin, self).execute(sql, params)
+        finally:
+            _record_query(time.perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return super(QueryCountingMixin, self).executemany(sql, param_list)
+        finally:
+            _record_query(time.perf_counter() - start)
+
+
+class QueryCountingCursor(QueryCountingMixin, CursorWrapper):
+    pass
+
+
+class QueryCountingDebugCursor(QueryCountingMixin, CursorDebugWrapper):
+    pass
+
+
+def _record_query(duration):
+    queries = getattr(_local, 'queries', None)
+    if queries is not None:
+        queries[0] += 1
+        queries[1] += duration
+
+
+def _install_query_counter(db):
+    """Make the cursors of `db` count queries, without keeping their SQL."""
+    if getattr(db, '_metrics_query_counter', False):
+        return
+    db.make_cursor = lambda cursor: QueryCountingCursor(cursor, db)
+    db.make_debug_cursor = lambda cursor: QueryCountingDebugCursor(cursor, db)
+    db._metrics_query_counter = True
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Record per-endpoint request duration, query count and time spent in
+    the database, template rendering and the phases marked with `phase()`.
+
+    Queries are counted and timed by a cursor wrapper that the
+    middleware installs on the database connection of each thread; the
+    SQL is not kept.
+    """
+    def process_request(self, request):
+        _install_query_counter(connections[DEFAULT_DB_ALIAS])
+        _local.phases = {}
+        _local.queries = [0, 0.0]
+        request._metrics_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # The response is rendered right after the middleware returns.
+        start = time.perf_counter()
+
+        def record_render(response):
+            phases = getattr(_local, 'phases', None)
+            if phases is not None:
+                phases['template'] = phases.get('template', 0) + time.perf_counter() - start
+
+        response.add_post_render_callback(record_render)
+        return response
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        query_count, query_time = _local.queries
+        phases = _local.phases
+        _local.phases = _local.queries = None
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match else 'unresolved'
+        phases['db'] = query_time
+
+        request_duration.observe(elapsed, endpoint=endpoint)
+        request_queries.observe(query_count, endpoint=endpoint)
+        for name, duration in phases.items():
+            phase_duration.observe(duration, endpoint=endpoint, phase=name)
+        return response
@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+_registries = []
+
+
+class Registry(object):
+    """
+    In-process snapshot of rarely changing configuration.
+
+    The snapshot is built by `load()` on first access and kept until
+    `invalidate()` is called, typically from model signal handlers.
+
+    Signals only reach the process that made the change. If
+    REGISTRY_VERSION_CHECK_INTERVAL is set, `invalidate()` also stores a
+    new version stamp in the cache backend, and every process reloads
+    its snapshot when it sees a changed stamp; the stamp is checked at
+    most once per interval (in seconds). The stamp only reaches other
+    processes through a shared cache backend; see `check_shared_cache()`.
+    """
+    def __init__(self, name):
+        _registries.append(self)
+        self.name = name
+        self._data = None
+        self._version = None
+        self._checked_at = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return 'registry:%s' % self.name
+
+    def load(self):
+        raise NotImplementedError()
+
+    def _check_version(self):
+        interval = getattr(settings, 'REGISTRY_VERSION_CHECK_INTERVAL', None)
+        if interval is None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        version = cache.get(self.version_key)
+        if version != self._version:
+            self._version = version
+            self._generation += 1
+            self._data = None
+
+    def get_data(self):
+        self._check_version()
+        data = self._data
+        if data is not None:
+            return data
+
+        with self._lock:
+            if self._data is not None:
+                return self._data
+            generation = self._generation
+            data = self.load()
+            # Do not keep a snapshot that was invalidated while loading.
+            if generation == self._generation:
+                self._data = data
+        return data
+
+    def invalidate(self, *args, **kwargs):
+        # Accepts and ignores arguments so that it can be connected
+        # directly as a signal receiver.
+        self._generation += 1
+        self._data = None
+        if getattr(settings, 'REGISTRY_VERSION_CHECK_INTERVAL', None) is not None:
+            self._version = uuid.uuid4().hex
+            cache.set(self.version_key, self._version, None)
+
+
+def invalidate_all():
+    """Drop the snapshots of all registries, e.g. between tests."""
+    for registry in _registries:
+        registry.invalidate()
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    System check: warn when changes cannot reach the registries of
+    other processes.
+    """
+    from django.core import checks
+
+    interval = getattr(settings, 'REGISTRY_VERSION_CHECK_INTERVAL', None)
+    if interval is None:
+        return [checks.Warning(
+            "REGISTRY_VERSION_CHECK_INTERVAL is None, so configuration changes made "
+            "in one process never reach the others.",
+            hint="Set it to a few seconds and use a shared cache backend.",
+            id='helsso.W001')]
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.rsplit('.', 1)[-1] in ('LocMemCache', 'DummyCache'):
+        return [checks.Warning(
+            "The default cache backend %s is not shared between processes, so "
+            "configuration changes made in one process never reach the others." % backend,
+            hint="Configure a shared cache backend such as memcached or redis in CACHES.",
+            id='helsso.W002')]
+    return []
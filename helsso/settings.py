@@ -51,6 +51,7 @@ INSTALLED_APPS = (
 
     'adfs_provider',
     'hkijwt',
+    'webhooks',
 )
 
 MIDDLEWARE_CLASSES = (
@@ -63,6 +64,8 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 )
+# To collect per-endpoint timings for /metrics/, add
+# 'helsso.metrics.MetricsMiddleware' first in MIDDLEWARE_CLASSES.
 
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
@@ -190,16 +193,117 @@ LOGGING = {
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+# /metrics/ is readable from METRICS_ALLOWED_IPS and with the bearer
+# token METRICS_TOKEN. Both are empty by default, so nobody can read it.
+# Behind a reverse proxy every request comes from the proxy's address,
+# so do not list that address; use the token instead.
+METRICS_ALLOWED_IPS = ()
+METRICS_TOKEN = None
+
+# How often (in seconds) in-process configuration registries (login
+# methods, application permissions, signing keys, ADFS realms, webhook
+# endpoints, applications) check the cache backend for changes made by
+# other processes. Changes reach other processes only through a shared
+# cache backend: when running several workers, configure CACHES with
+# e.g. memcached or redis. None disables the check, and changes then only
+# reach other processes when they restart.
+REGISTRY_VERSION_CHECK_INTERVAL = 10
+
+# How long (in seconds) rendered login pages are kept in the cache
+LOGIN_PAGE_CACHE_TIMEOUT = 3600
+
 OAUTH2_PROVIDER_APPLICATION_MODEL = 'users.Application'
 OAUTH2_PROVIDER = {
     'CLIENT_SECRET_GENERATOR_LENGTH': 96,
+    'OAUTH2_VALIDATOR_CLASS': 'users.oauth2_validators.OAuth2Validator',
 }
 
+# Number of OAuth2 applications kept in memory, and for how many seconds
+APPLICATION_CACHE_SIZE = 1000
+APPLICATION_CACHE_TTL = 300
+# Unknown client ids are remembered separately, so that requests with
+# made-up client ids cannot push real applications out of the cache
+APPLICATION_MISS_CACHE_SIZE = 1000
+APPLICATION_MISS_CACHE_TTL = 5
+
+# Validated access tokens are cached until they expire, but for at most
+# ACCESS_TOKEN_CACHE_TIMEOUT seconds. Each process also keeps up to
+# ACCESS_TOKEN_LOCAL_CACHE_SIZE tokens in memory for
+# ACCESS_TOKEN_LOCAL_CACHE_TTL seconds; revocations made by other
+# processes take effect after that.
+ACCESS_TOKEN_CACHE_TIMEOUT = 3600
+ACCESS_TOKEN_LOCAL_CACHE_SIZE = 10000
+ACCESS_TOKEN_LOCAL_CACHE_TTL = 5
+
+# Expired tokens, grants and sessions are deleted REAPER_BATCH_SIZE rows
+# at a time, waiting REAPER_BATCH_DELAY seconds between batches. With
+# REAPER_INTERVAL set, web processes do it every REAPER_INTERVAL seconds
+# in a background thread; otherwise run the reap_expired command.
+REAPER_BATCH_SIZE = 500
+REAPER_BATCH_DELAY = 0.1
+REAPER_INTERVAL = None
+
+# Seconds a user change must have been recorded before the change feed
+# returns it; covers transactions that commit out of sequence order.
+# Changes from transactions that stay open longer than this can be missed
+# by replicas, so it must exceed the longest transaction that saves users.
+USER_CHANGE_FEED_LAG = 5
+
+# Requests to upstream identity providers share keep-alive connection
+# pools for UPSTREAM_HTTP_POOL_CONNECTIONS hosts, of at most
+# UPSTREAM_HTTP_POOL_MAXSIZE connections each. Failed connection attempts
+# are retried UPSTREAM_HTTP_RETRIES times. Timeouts are in seconds. With
+# UPSTREAM_HTTP_PATCH_ALLAUTH, allauth's providers use the pools too.
+UPSTREAM_HTTP_POOL_CONNECTIONS = 10
+UPSTREAM_HTTP_POOL_MAXSIZE = 20
+UPSTREAM_HTTP_RETRIES = 2
+UPSTREAM_HTTP_CONNECT_TIMEOUT = 3
+UPSTREAM_HTTP_TIMEOUT = 10
+UPSTREAM_HTTP_PATCH_ALLAUTH = True
+
+# Timeouts in seconds for connecting to the ADFS token endpoint and for
+# its response. After ADFS_CIRCUIT_FAILURES failed token requests in a row,
+# ADFS logins fail fast for ADFS_CIRCUIT_RESET seconds.
+ADFS_TOKEN_CONNECT_TIMEOUT = 3
+ADFS_TOKEN_TIMEOUT = 5
+ADFS_CIRCUIT_FAILURES = 5
+ADFS_CIRCUIT_RESET = 30
+
+# On logout, applications with a back-channel logout URI are sent logout
+# tokens by BACKCHANNEL_LOGOUT_CONCURRENCY threads; the logout waits for
+# them for at most BACKCHANNEL_LOGOUT_TIMEOUT seconds in total. Slower
+# deliveries go on in the background for up to
+# BACKCHANNEL_LOGOUT_REQUEST_TIMEOUT seconds each.
+BACKCHANNEL_LOGOUT_CONCURRENCY = 8
+BACKCHANNEL_LOGOUT_TIMEOUT = 2
+BACKCHANNEL_LOGOUT_REQUEST_TIMEOUT = 5
+
+# Webhook deliveries are made by the run_webhook_worker command with
+# WEBHOOK_CONCURRENCY threads. A failed delivery is retried after
+# WEBHOOK_RETRY_BASE_DELAY seconds, doubling up to WEBHOOK_RETRY_MAX_DELAY,
+# until WEBHOOK_MAX_ATTEMPTS attempts. A worker holds the deliveries it is
+# sending for WEBHOOK_LOCK_TIMEOUT seconds.
+WEBHOOK_CONCURRENCY = 4
+WEBHOOK_TIMEOUT = 5
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_RETRY_BASE_DELAY = 10
+WEBHOOK_RETRY_MAX_DELAY = 3600
+WEBHOOK_LOCK_TIMEOUT = 60
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.ext.rest_framework.OAuth2Authentication',
+        'users.authentication.CachedOAuth2Authentication',
     )
 }
+
+# Issuer ('iss') of the JWTs handed out by /jwt-token/
+JWT_ISSUER = 'https://api.hel.fi/sso'
+# HS256 signs with the target app's client secret. RS256 and ES256 sign
+# with the key set managed by 'manage.py rotate_jwt_signing_key'; the
+# public keys are published at /.well-known/jwks.json.
+JWT_SIGNING_ALGORITHM = 'HS256'
+JWKS_MAX_AGE = 24 * 3600
+
 CSRF_COOKIE_NAME = 'sso-csrftoken'
 SESSION_COOKIE_NAME = 'sso-sessionid'
 
@@ -4,8 +4,10 @@ from django.contrib import admin
 from django.http import HttpResponse
 from django.contrib.staticfiles import views as static_views
 from django.views.defaults import permission_denied
-from .api import UserView, GetJWTView
-from users.views import LoginView, LogoutView
+from .api import UserView, UserListView, UserChangeFeedView, GetJWTView, GetJWTBatchView, IntrospectTokenView, IntrospectTokensView
+from .metrics import metrics_view
+from hkijwt.views import jwks_view
+from users.views import AuthorizationView, LoginView, LogoutView
 
 
 def show_login(request):
@@ -23,12 +25,20 @@ urlpatterns = [
     url(r'^accounts/profile/', show_login),
     url(r'^accounts/', include('allauth.urls')),
     url(r'^oauth2/applications/', permission_denied),
+    url(r'^oauth2/authorize/$', AuthorizationView.as_view()),
     url(r'^oauth2/', include('oauth2_provider.urls', namespace='oauth2_provider')),
     url(r'^user/(?P<username>[\w.@+-]+)/?$', UserView.as_view()),
     url(r'^user/$', UserView.as_view()),
+    url(r'^users/$', UserListView.as_view()),
+    url(r'^users/changes/$', UserChangeFeedView.as_view()),
     url(r'^jwt-token/$', GetJWTView.as_view()),
+    url(r'^jwt-token/batch/$', GetJWTBatchView.as_view()),
+    url(r'^introspect/$', IntrospectTokenView.as_view()),
+    url(r'^introspect/bulk/$', IntrospectTokensView.as_view()),
     url(r'^login/$', LoginView.as_view()),
-    url(r'^logout/$', LogoutView.as_view())
+    url(r'^logout/$', LogoutView.as_view()),
+    url(r'^metrics/$', metrics_view),
+    url(r'^\.well-known/jwks\.json$', jwks_view),
 ]
 
 if settings.DEBUG:
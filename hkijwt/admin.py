@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import AppToAppPermission
+from .models import AppToAppPermission, SigningKey
 
 
 class AppToAppPermissionAdmin(admin.ModelAdmin):
     pass
 admin.site.register(AppToAppPermission, AppToAppPermissionAdmin)
+
+
+class SigningKeyAdmin(admin.ModelAdmin):
+    list_display = ('kid', 'algorithm', 'created_at', 'activate_at', 'retire_at')
+    list_filter = ('algorithm',)
+admin.site.register(SigningKey, SigningKeyAdmin)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class HKIJWTConfig(AppConfig):
+    name = 'hkijwt'
+    verbose_name = 'JWT'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals
@@ -0,0 +1,76 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from helsso import metrics
+
+KEY_PREFIX = 'hkijwt'
+PERMISSIONS_VERSION_KEY = KEY_PREFIX + ':perms'
+SIGNING_KEYS_VERSION_KEY = KEY_PREFIX + ':keys'
+
+hits = metrics.counter('hkijwt_token_cache_hits_total', "JWTs served from cache")
+misses = metrics.counter('hkijwt_token_cache_misses_total', "JWTs signed because of a cache miss")
+
+
+def _user_version_key(user_id):
+    return '%s:user:%s' % (KEY_PREFIX, user_id)
+
+
+def _bump(key):
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def invalidate_user(user_id):
+    _bump(_user_version_key(user_id))
+
+
+def invalidate_permissions():
+    _bump(PERMISSIONS_VERSION_KEY)
+
+
+def invalidate_signing_keys():
+    _bump(SIGNING_KEYS_VERSION_KEY)
+
+
+def _token_key(access_token, target, user_id):
+    """
+    Return the cache key for the JWT issued with `access_token` for
+    app `target`. The key includes the signing algorithm and the current
+    user, permission and signing key versions, so bumping any of them
+    orphans all the affected entries.
+    """
+    version_keys = [_user_version_key(user_id), PERMISSIONS_VERSION_KEY, SIGNING_KEYS_VERSION_KEY]
+    versions = cache.get_many(version_keys)
+    for key in version_keys:
+        if key not in versions:
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    digest = hashlib.sha256()
+    parts = [access_token, target, settings.JWT_SIGNING_ALGORITHM]
+    parts += [versions[key] for key in version_keys]
+    for part in parts:
+        digest.update(part.encode('utf8'))
+        digest.update(b'\0')
+    return '%s:token:%s' % (KEY_PREFIX, digest.hexdigest())
+
+
+def get_token(access_token, target, user_id):
+    """Return a (key, token) tuple; token is None on a cache miss."""
+    key = _token_key(access_token, target, user_id)
+    token = cache.get(key)
+    if token is None:
+        misses.inc()
+    else:
+        hits.inc()
+    return key, token
+
+
+def set_token(key, token, expires):
+    timeout = int((expires - timezone.now()).total_seconds())
+    if timeout > 0:
+        cache.set(key, token, timeout)
@@ -0,0 +1,21 @@
+CLAIM_FIELDS = ('username', 'email', 'first_name', 'last_name', 'department_name')
+COLUMNS = CLAIM_FIELDS + ('uuid',)
+
+
+def _build(values):
+    claims = {field: values[field] for field in CLAIM_FIELDS}
+    if values['first_name'] and values['last_name']:
+        claims['display_name'] = '%s %s' % (values['first_name'], values['last_name'])
+    claims['sub'] = str(values['uuid'])
+    return claims
+
+
+def user_claims(user):
+    """
+    Return the user claims of a JWT for `user`.
+
+    Produces the same claims as serializing the user with UserSerializer
+    and dropping the fields not included in tokens, without the
+    serializer machinery.
+    """
+    return _build({field: getattr(user, field) for field in COLUMNS})
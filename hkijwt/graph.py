@@ -0,0 +1,50 @@
+from oauth2_provider.models import get_application_model
+
+from helsso.registry import Registry
+
+from .models import AppToAppPermission
+
+
+class AppRecord(object):
+    __slots__ = ('id', 'pk', 'client_id', 'client_secret', 'name')
+
+    def __init__(self, id, client_id, client_secret, name):
+        self.id = id
+        self.pk = id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.name = name
+
+    def __str__(self):
+        return self.name or self.client_id
+
+
+class AppPermissionGraph(Registry):
+    """
+    Applications and the app-to-app permissions between them.
+
+    Holds client id -> AppRecord and requester app id -> set of target
+    client ids, so that permission checks are dictionary lookups.
+    """
+    def load(self):
+        apps = {}
+        for row in get_application_model().objects.values_list(
+                'id', 'client_id', 'client_secret', 'name'):
+            record = AppRecord(*row)
+            apps[record.client_id] = record
+
+        targets = {}
+        for requester_id, target_client_id in AppToAppPermission.objects.values_list(
+                'requester_id', 'target__client_id'):
+            targets.setdefault(requester_id, set()).add(target_client_id)
+
+        return apps, targets
+
+    def get_app(self, client_id):
+        return self.get_data()[0].get(client_id)
+
+    def has_permission(self, requester_id, target_client_id):
+        return target_client_id in self.get_data()[1].get(requester_id, ())
+
+
+app_permissions = AppPermissionGraph('hkijwt_app_permissions')
@@ -0,0 +1,104 @@
+import base64
+import uuid
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from django.conf import settings
+from django.utils import timezone
+
+from helsso.registry import Registry
+
+from .models import SigningKey
+
+backend = default_backend()
+
+
+def generate_private_key(algorithm):
+    """Generate a new private key for `algorithm` as a PEM string."""
+    if algorithm == 'RS256':
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=backend)
+    elif algorithm == 'ES256':
+        key = ec.generate_private_key(ec.SECP256R1(), backend)
+    else:
+        raise ValueError("Unsupported signing algorithm: %s" % algorithm)
+    pem = key.private_bytes(serialization.Encoding.PEM,
+                            serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    return pem.decode('ascii')
+
+
+def generate_kid():
+    return uuid.uuid4().hex
+
+
+def _b64_uint(value, length=None):
+    if length is None:
+        length = (value.bit_length() + 7) // 8
+    data = value.to_bytes(length, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def public_jwk(kid, algorithm, public_key):
+    jwk = {'kid': kid, 'alg': algorithm, 'use': 'sig'}
+    numbers = public_key.public_numbers()
+    if algorithm == 'RS256':
+        jwk.update(kty='RSA', n=_b64_uint(numbers.n), e=_b64_uint(numbers.e))
+    else:
+        jwk.update(kty='EC', crv='P-256',
+                   x=_b64_uint(numbers.x, 32), y=_b64_uint(numbers.y, 32))
+    return jwk
+
+
+class LoadedKey(object):
+    def __init__(self, signing_key):
+        self.kid = signing_key.kid
+        self.algorithm = signing_key.algorithm
+        self.activate_at = signing_key.activate_at
+        self.retire_at = signing_key.retire_at
+        self.private_key = serialization.load_pem_private_key(
+            signing_key.private_key.encode('ascii'), password=None, backend=backend)
+        self.jwk = public_jwk(self.kid, self.algorithm, self.private_key.public_key())
+
+    def is_published(self, now):
+        return self.retire_at is None or self.retire_at > now
+
+    def can_sign(self, now):
+        return self.activate_at <= now and self.is_published(now)
+
+
+class SigningKeySet(Registry):
+    """Parsed signing keys, newest first."""
+    def load(self):
+        return [LoadedKey(key) for key in SigningKey.objects.all()]
+
+    def get_signing_key(self, algorithm):
+        now = timezone.now()
+        for key in self.get_data():
+            if key.algorithm == algorithm and key.can_sign(now):
+                return key
+        raise SigningKey.DoesNotExist("No active %s signing key" % algorithm)
+
+    def get_jwks(self):
+        now = timezone.now()
+        return {'keys': [key.jwk for key in self.get_data() if key.is_published(now)]}
+
+
+signing_keys = SigningKeySet('hkijwt_signing_keys')
+
+
+def sign_jwt(payload, secret):
+    """
+    Sign `payload` with the algorithm in JWT_SIGNING_ALGORITHM.
+
+    HS256 uses `secret` (the target app's client secret); the
+    asymmetric algorithms use the current key from the key set and
+    name it in the `kid` header.
+    """
+    algorithm = settings.JWT_SIGNING_ALGORITHM
+    if algorithm == 'HS256':
+        return jwt.encode(payload, secret, algorithm=algorithm)
+    key = signing_keys.get_signing_key(algorithm)
+    return jwt.encode(payload, key.private_key, algorithm=algorithm,
+                      headers={'kid': key.kid})
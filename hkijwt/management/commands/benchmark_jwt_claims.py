@@ -0,0 +1,26 @@
+import timeit
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from hkijwt.claims import user_claims
+from hkijwt.testing import serializer_claims
+
+
+class Command(BaseCommand):
+    help = "Compare the CPU cost of building JWT claims with and without UserSerializer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        user = get_user_model()(
+            username='meikalainenm', email='matti.meikalainen@hel.fi',
+            first_name='Matti', last_name='Meikäläinen', department_name='kymp',
+            uuid=uuid.uuid4(), last_login=timezone.now(), date_joined=timezone.now())
+        for label, func in (('UserSerializer', serializer_claims), ('hkijwt.claims', user_claims)):
+            elapsed = timeit.timeit(lambda: func(user), number=iterations)
+            self.stdout.write('%-20s %8.1f us/token' % (label, elapsed / iterations * 1e6))
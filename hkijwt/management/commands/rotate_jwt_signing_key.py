@@ -0,0 +1,53 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from hkijwt.keys import generate_kid, generate_private_key
+from hkijwt.models import SigningKey
+
+
+class Command(BaseCommand):
+    help = "Create a new JWT signing key and schedule the previous ones for retirement"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=[a[0] for a in SigningKey.ALGORITHMS],
+                            default=settings.JWT_SIGNING_ALGORITHM if settings.JWT_SIGNING_ALGORITHM != 'HS256' else 'RS256')
+        parser.add_argument('--activate-now', action='store_true',
+                            help="Sign with the new key immediately instead of after JWKS_MAX_AGE, "
+                                 "before all verifiers may have fetched it. Implied when no key "
+                                 "of the algorithm can sign yet.")
+        parser.add_argument('--retire-after', type=int, default=7 * 24 * 3600,
+                            help="Seconds to keep publishing the previous keys after the new key "
+                                 "takes over; should exceed the longest access token lifetime")
+
+    def handle(self, *args, **options):
+        algorithm = options['algorithm']
+        now = timezone.now()
+        can_sign = SigningKey.objects.filter(algorithm=algorithm, activate_at__lte=now)\
+            .exclude(retire_at__lte=now).exists()
+        if options['activate_now'] or not can_sign:
+            # Without a key that can sign, no JWTs can be issued at all;
+            # waiting for verifiers to fetch the new key would only
+            # make that last longer.
+            activate_at = now
+        else:
+            activate_at = now + datetime.timedelta(seconds=settings.JWKS_MAX_AGE)
+        retire_at = activate_at + datetime.timedelta(seconds=options['retire_after'])
+
+        with transaction.atomic():
+            retired = SigningKey.objects.filter(algorithm=algorithm, activate_at__lte=activate_at)\
+                .exclude(retire_at__lt=retire_at)
+            # Use save() rather than update() so that signal handlers
+            # refresh the in-process key set.
+            for key in retired:
+                key.retire_at = retire_at
+                key.save(update_fields=['retire_at'])
+            key = SigningKey.objects.create(
+                kid=generate_kid(), algorithm=algorithm,
+                private_key=generate_private_key(algorithm), activate_at=activate_at)
+
+        self.stdout.write("Created %s key %s, signing from %s" % (algorithm, key.kid, activate_at))
+        self.stdout.write("Retiring %d previous key(s) at %s" % (len(retired), retire_at))
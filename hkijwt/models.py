@@ -10,3 +10,29 @@ class AppToAppPermission(models.Model):
 
     def __str__(self):
         return "%s -> %s" % (self.requester, self.target)
+
+
+class SigningKey(models.Model):
+    """
+    Private key for signing JWTs asymmetrically.
+
+    The newest active key of the configured algorithm signs new tokens.
+    Keys stay published in the JWKS until `retire_at`, so that tokens
+    signed with them can still be verified.
+    """
+    ALGORITHMS = (
+        ('RS256', 'RS256'),
+        ('ES256', 'ES256'),
+    )
+    kid = models.CharField(max_length=64, unique=True)
+    algorithm = models.CharField(max_length=10, choices=ALGORITHMS)
+    private_key = models.TextField(editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activate_at = models.DateTimeField(db_index=True)
+    retire_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ('-activate_at',)
+
+    def __str__(self):
+        return "%s (%s)" % (self.kid, self.algorithm)
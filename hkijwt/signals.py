@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from oauth2_provider.models import get_application_model
+
+from . import cache as jwt_cache
+from .graph import app_permissions
+from .keys import signing_keys
+from .models import AppToAppPermission, SigningKey
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, **kwargs):
+    jwt_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=AppToAppPermission)
+@receiver(post_delete, sender=AppToAppPermission)
+@receiver(post_save, sender=get_application_model())
+@receiver(post_delete, sender=get_application_model())
+def invalidate_app_permissions(sender, **kwargs):
+    app_permissions.invalidate()
+    jwt_cache.invalidate_permissions()
+
+
+@receiver(post_save, sender=SigningKey)
+@receiver(post_delete, sender=SigningKey)
+def invalidate_signing_keys(sender, **kwargs):
+    signing_keys.invalidate()
+    jwt_cache.invalidate_signing_keys()
@@ -0,0 +1,14 @@
+"""
+Helpers for testing and benchmarking JWT issuance.
+"""
+from helsso.api import UserSerializer
+
+
+def serializer_claims(user):
+    """The serializer-based payload used before hkijwt.claims, for comparison."""
+    payload = UserSerializer(user).data
+    for field in ['last_login', 'date_joined', 'uuid']:
+        if field in payload:
+            del payload[field]
+    payload['sub'] = str(user.uuid)
+    return payload
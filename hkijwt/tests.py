@@ -1,3 +1,229 @@
-from django.test import TestCase
+import datetime
+import io
+import uuid
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives import serialization
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from helsso.api import GetJWTBatchView
+from users.models import Application
+from users.testing import BenchmarkDataMixin, bearer
+
+from . import cache as jwt_cache
+from .claims import user_claims
+from .graph import app_permissions
+from .keys import backend, generate_kid, generate_private_key
+from .models import AppToAppPermission, SigningKey
+from .testing import serializer_claims
+
+
+def create_key(algorithm='RS256', activate_at=None):
+    return SigningKey.objects.create(
+        kid=generate_kid(), algorithm=algorithm, private_key=generate_private_key(algorithm),
+        activate_at=activate_at or timezone.now() - datetime.timedelta(seconds=1))
+
+
+class JWTTestCase(BenchmarkDataMixin, TestCase):
+    def get_token(self, **params):
+        response = self.client.get('/jwt-token/', params, **bearer('bench-user-0'))
+        self.assertEqual(response.status_code, 200)
+        return response.data['token']
+
+
+@override_settings(JWT_SIGNING_ALGORITHM='RS256')
+class SigningKeyCacheTests(JWTTestCase):
+    def test_deleted_key_is_not_served_from_cache(self):
+        create_key()
+        token = self.get_token()
+        SigningKey.objects.all().delete()
+        new_key = create_key()
+        new_token = self.get_token()
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(jwt.get_unverified_header(new_token)['kid'], new_key.kid)
+
+    def test_algorithm_change_is_not_served_from_cache(self):
+        create_key()
+        with override_settings(JWT_SIGNING_ALGORITHM='HS256'):
+            self.assertEqual(jwt.get_unverified_header(self.get_token())['alg'], 'HS256')
+        self.assertEqual(jwt.get_unverified_header(self.get_token())['alg'], 'RS256')
+
+
+def can_sign(algorithm):
+    # PyJWT 1.4 cannot sign ES256 with cryptography releases newer than
+    # the one in requirements.txt.
+    try:
+        jwt.encode({}, serialization.load_pem_private_key(
+            generate_private_key(algorithm).encode('ascii'), password=None, backend=backend),
+            algorithm=algorithm)
+    except NameError:
+        return False
+    return True
+
+
+class AsymmetricSigningTests(JWTTestCase):
+    def verify(self, token, key):
+        private_key = serialization.load_pem_private_key(
+            key.private_key.encode('ascii'), password=None, backend=backend)
+        return jwt.decode(token, private_key.public_key(), algorithms=[key.algorithm],
+                          audience='bench-app')
+
+    def test_rs256_and_es256(self):
+        for algorithm in ('RS256', 'ES256'):
+            with self.subTest(algorithm=algorithm), override_settings(JWT_SIGNING_ALGORITHM=algorithm):
+                if not can_sign(algorithm):
+                    self.skipTest("PyJWT cannot sign %s with this cryptography version" % algorithm)
+                key = create_key(algorithm)
+                token = self.get_token()
+                self.assertEqual(jwt.get_unverified_header(token)['kid'], key.kid)
+                self.assertEqual(self.verify(token, key)['username'], 'bench-user-0')
+
+    @override_settings(JWT_SIGNING_ALGORITHM='RS256')
+    def test_no_signing_key(self):
+        create_key(activate_at=timezone.now() + datetime.timedelta(hours=1))
+        response = self.client.get('/jwt-token/', **bearer('bench-user-0'))
+        self.assertEqual(response.status_code, 503)
+
+    def test_jwks(self):
+        active = create_key('RS256')
+        ec_key = create_key('ES256')
+        retired = create_key('RS256')
+        retired.retire_at = timezone.now()
+        retired.save()
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertIn('max-age', response['Cache-Control'])
+        keys = {key['kid']: key for key in response.json()['keys']}
+        self.assertEqual(set(keys), {active.kid, ec_key.kid})
+        self.assertEqual((keys[active.kid]['kty'], keys[ec_key.kid]['kty']), ('RSA', 'EC'))
+
+
+@override_settings(JWT_SIGNING_ALGORITHM='RS256')
+class RotationTests(JWTTestCase):
+    def rotate(self):
+        call_command('rotate_jwt_signing_key', stdout=io.StringIO())
+        return SigningKey.objects.order_by('-id')[0]
+
+    def test_first_key_signs_immediately(self):
+        key = self.rotate()
+        self.assertLessEqual(key.activate_at, timezone.now())
+        self.assertEqual(jwt.get_unverified_header(self.get_token())['kid'], key.kid)
+
+    def test_rotation(self):
+        first = self.rotate()
+        second = self.rotate()
+        self.assertGreater(second.activate_at, timezone.now())
+        first.refresh_from_db()
+        self.assertGreater(first.retire_at, second.activate_at)
+        # The previous key signs until the new one takes over; both are published
+        self.assertEqual(jwt.get_unverified_header(self.get_token())['kid'], first.kid)
+        kids = set(key['kid'] for key in self.client.get('/.well-known/jwks.json').json()['keys'])
+        self.assertEqual(kids, {first.kid, second.kid})
+
+
+class TokenCacheTests(JWTTestCase):
+    def test_hit(self):
+        token = self.get_token()
+        hits = jwt_cache.hits.value
+        self.assertEqual(self.get_token(), token)
+        self.assertEqual(jwt_cache.hits.value, hits + 1)
+
+    def test_user_change(self):
+        token = self.get_token()
+        user = self.data.users[0]
+        user.first_name = 'Changed'
+        user.save()
+        new_token = self.get_token()
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(jwt.decode(new_token, verify=False)['first_name'], 'Changed')
+
+    def test_permission_change(self):
+        self.get_token(target_app='bench-target')
+        AppToAppPermission.objects.all().delete()
+        response = self.client.get('/jwt-token/', {'target_app': 'bench-target'}, **bearer('bench-user-0'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_revoked_token(self):
+        self.get_token()
+        AccessToken.objects.get(token='bench-user-0').revoke()
+        response = self.client.get('/jwt-token/', **bearer('bench-user-0'))
+        self.assertEqual(response.status_code, 401)
+
+
+class BatchTests(JWTTestCase):
+    def get_batch(self, targets):
+        return self.client.get('/jwt-token/batch/', {'target_app': targets}, **bearer('bench-user-0'))
+
+    def test_mixed_targets(self):
+        Application.objects.create(user=self.data.admin, name='Other', client_id='other',
+                                   client_type='confidential',
+                                   authorization_grant_type='authorization-code')
+        response = self.get_batch(['bench-target,bench-app', 'missing', 'other'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['tokens']), {'bench-target', 'bench-app'})
+        self.assertEqual(set(response.data['errors']), {'missing', 'other'})
+        self.assertEqual(response.data['errors']['missing'], "app not found")
+        claims = jwt.decode(response.data['tokens']['bench-app'], self.data.app.client_secret,
+                            audience='bench-app')
+        self.assertEqual(claims['username'], 'bench-user-0')
+        # Served from the same cache entries as /jwt-token/
+        self.assertEqual(self.get_token(target_app='bench-target'), response.data['tokens']['bench-target'])
+
+    def test_self_target(self):
+        # The same with a cold cache and with one filled by the batch view
+        implicit = self.get_token()
+        self.assertEqual(self.get_token(target_app='bench-app'), implicit)
+        cache.clear()
+        explicit = self.get_token(target_app='bench-app')
+        self.assertEqual(self.get_batch(['bench-app']).data['tokens']['bench-app'], explicit)
+        self.assertEqual(jwt.decode(explicit, self.data.app.client_secret, audience='bench-app')['username'],
+                         'bench-user-0')
+
+    def test_invalid_target_lists(self):
+        self.assertEqual(self.get_batch([]).status_code, 400)
+        self.assertEqual(self.get_batch([' , ']).status_code, 400)
+        too_many = ','.join('app-%d' % i for i in range(GetJWTBatchView.max_targets + 1))
+        self.assertEqual(self.get_batch([too_many]).status_code, 400)
+
+
+class AppPermissionGraphTests(BenchmarkDataMixin, TestCase):
+    user_count = 0
+
+    def test_grant_and_revoke(self):
+        self.assertTrue(app_permissions.has_permission(self.data.app.pk, 'bench-target'))
+        self.assertFalse(app_permissions.has_permission(self.data.target_app.pk, 'bench-app'))
+        with self.assertNumQueries(0):
+            app_permissions.has_permission(self.data.app.pk, 'bench-target')
+
+        permission = AppToAppPermission.objects.create(requester=self.data.target_app, target=self.data.app)
+        self.assertTrue(app_permissions.has_permission(self.data.target_app.pk, 'bench-app'))
+        permission.delete()
+        self.assertFalse(app_permissions.has_permission(self.data.target_app.pk, 'bench-app'))
+
+    def test_application_changes(self):
+        self.assertIsNone(app_permissions.get_app('new'))
+        app = Application.objects.create(user=self.data.admin, name='New', client_id='new',
+                                         client_type='confidential',
+                                         authorization_grant_type='authorization-code')
+        self.assertEqual(app_permissions.get_app('new').pk, app.pk)
+        self.data.target_app.delete()
+        self.assertIsNone(app_permissions.get_app('bench-target'))
+        self.assertFalse(app_permissions.has_permission(self.data.app.pk, 'bench-target'))
+
+
+class ClaimsTests(TestCase):
+    def test_same_as_serializer(self):
+        User = get_user_model()
+        users = [
+            User(username='meikalainenm', email='matti.meikalainen@hel.fi', first_name='Matti',
+                 last_name='Meikäläinen', department_name='kymp', uuid=uuid.uuid4(),
+                 last_login=timezone.now(), date_joined=timezone.now()),
+            User(username='nameless', email='', first_name='', last_name='Only',
+                 department_name=None, uuid=uuid.uuid4(), date_joined=timezone.now()),
+        ]
+        for user in users:
+            self.assertEqual(user_claims(user), serializer_claims(user))
@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
 
-# Create your views here.
+from .keys import signing_keys
+
+
+def jwks_view(request):
+    response = JsonResponse(signing_keys.get_jwks())
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+    return response
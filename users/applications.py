@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from helsso.registry import Registry
+
+from .models import Application
+
+
+class ApplicationCache(Registry):
+    """
+    Client id -> Application, with the login methods prefetched.
+
+    Unlike the other registries, applications are fetched one at a time
+    as they are asked for. At most APPLICATION_CACHE_SIZE applications
+    are kept, least recently used first out, and each for at most
+    APPLICATION_CACHE_TTL seconds. Unknown client ids are kept apart, at
+    most APPLICATION_MISS_CACHE_SIZE of them for
+    APPLICATION_MISS_CACHE_TTL seconds, so that they cannot evict
+    applications.
+    """
+    def __init__(self, name):
+        super(ApplicationCache, self).__init__(name)
+        self._entries_lock = threading.Lock()
+
+    def load(self):
+        return OrderedDict(), OrderedDict()
+
+    def fetch(self, client_id):
+        apps = list(Application.objects.filter(client_id=client_id).prefetch_related('login_methods'))
+        return apps[0] if apps else None
+
+    @staticmethod
+    def _put(entries, key, value, ttl, size):
+        entries[key] = (value, time.monotonic() + ttl)
+        entries.move_to_end(key)
+        while len(entries) > size:
+            entries.popitem(last=False)
+
+    def get(self, client_id):
+        """Return the application with `client_id` or None."""
+        entries, misses = self.get_data()
+        now = time.monotonic()
+        with self._entries_lock:
+            for cached in (entries, misses):
+                entry = cached.get(client_id)
+                if entry is not None and entry[1] > now:
+                    cached.move_to_end(client_id)
+                    return entry[0]
+
+        app = self.fetch(client_id)
+        with self._entries_lock:
+            if app is None:
+                self._put(misses, client_id, None, settings.APPLICATION_MISS_CACHE_TTL,
+                          settings.APPLICATION_MISS_CACHE_SIZE)
+            else:
+                misses.pop(client_id, None)
+                self._put(entries, client_id, app, settings.APPLICATION_CACHE_TTL,
+                          settings.APPLICATION_CACHE_SIZE)
+        return app
+
+
+applications = ApplicationCache('applications')
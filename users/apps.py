@@ -9,3 +9,17 @@ class UsersConfig(AppConfig):
     def ready(self):
         # Register signal handlers
         from . import signals
+
+        from django.core import checks
+        from helsso.registry import check_shared_cache
+        checks.register(check_shared_cache)
+
+        from django.conf import settings
+        if settings.UPSTREAM_HTTP_PATCH_ALLAUTH:
+            from helsso.http import patch_allauth
+            patch_allauth()
+
+        if settings.REAPER_INTERVAL is not None:
+            from django.core.signals import request_started
+            from .reaper import start_background_reaper
+            request_started.connect(start_background_reaper)
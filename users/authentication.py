@@ -0,0 +1,289 @@
+"""
+Cached OAuth2 bearer token authentication for the REST API.
+
+Validated access tokens are kept in the cache backend, keyed by a hash
+of the token, until they expire. The token's user is cached alongside
+it. Each process also keeps recently used tokens in memory for
+ACCESS_TOKEN_LOCAL_CACHE_TTL seconds; changes made by other processes
+reach it only after that time.
+
+Deleting or changing an access token or its user drops the cached
+entries from the shared cache through signal handlers, so revoked
+tokens stop working right away.
+"""
+import base64
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote_plus
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from oauth2_provider.ext.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from helsso import metrics
+from helsso.registry import Registry
+
+from .applications import applications
+
+KEY_PREFIX = 'oauth2'
+
+hits = metrics.counter('helsso_access_token_cache_hits_total',
+                       "Access tokens found in cache")
+misses = metrics.counter('helsso_access_token_cache_misses_total',
+                         "Access tokens looked up from the database")
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf8')).hexdigest()
+
+
+def _token_key(token_hash):
+    return '%s:token:%s' % (KEY_PREFIX, token_hash)
+
+
+def _user_key(user_id):
+    return '%s:user:%s' % (KEY_PREFIX, user_id)
+
+
+class CachedAccessToken(object):
+    """
+    The parts of an AccessToken the API uses, with the same validity
+    checks as the model.
+    """
+    def __init__(self, token, user_id, application_id, client_id, scope, expires):
+        self.token = token
+        self.user_id = user_id
+        self.application_id = application_id
+        self.client_id = client_id
+        self.scope = scope
+        self.expires = expires
+
+    @classmethod
+    def from_model(cls, access_token):
+        return cls(access_token.token, access_token.user_id, access_token.application_id,
+                   access_token.application.client_id, access_token.scope, access_token.expires)
+
+    def to_dict(self):
+        # The token itself is not stored; the cache key is its hash.
+        return dict(user_id=self.user_id, application_id=self.application_id,
+                    client_id=self.client_id, scope=self.scope, expires=self.expires)
+
+    @property
+    def application(self):
+        return applications.get(self.client_id)
+
+    def is_expired(self):
+        return timezone.now() >= self.expires
+
+    def allow_scopes(self, scopes):
+        if not scopes:
+            return True
+        return set(scopes).issubset(set(self.scope.split()))
+
+    def is_valid(self, scopes=None):
+        return not self.is_expired() and self.allow_scopes(scopes) and self.application is not None
+
+
+class LocalTokenCache(Registry):
+    """
+    Bounded in-process cache of (token, user) pairs, with the token
+    hashes of each user indexed for `discard()`.
+    """
+    def __init__(self, name):
+        super(LocalTokenCache, self).__init__(name)
+        self._entries_lock = threading.Lock()
+
+    def load(self):
+        return OrderedDict(), {}
+
+    @staticmethod
+    def _remove(entries, by_user, token_hash):
+        entry = entries.pop(token_hash, None)
+        if entry is None:
+            return
+        hashes = by_user.get(entry[1].pk)
+        if hashes is not None:
+            hashes.discard(token_hash)
+            if not hashes:
+                del by_user[entry[1].pk]
+
+    def get(self, token_hash):
+        entries, by_user = self.get_data()
+        with self._entries_lock:
+            entry = entries.get(token_hash)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(entries, by_user, token_hash)
+                return None
+            entries.move_to_end(token_hash)
+            return entry[0], entry[1]
+
+    def set(self, token_hash, access_token, user):
+        timeout = settings.ACCESS_TOKEN_LOCAL_CACHE_TTL
+        if not timeout:
+            return
+        entries, by_user = self.get_data()
+        with self._entries_lock:
+            self._remove(entries, by_user, token_hash)
+            entries[token_hash] = (access_token, user, time.monotonic() + timeout)
+            by_user.setdefault(user.pk, set()).add(token_hash)
+            while len(entries) > settings.ACCESS_TOKEN_LOCAL_CACHE_SIZE:
+                self._remove(entries, by_user, next(iter(entries)))
+
+    def discard(self, token_hash=None, user_id=None):
+        entries, by_user = self.get_data()
+        with self._entries_lock:
+            if token_hash is not None:
+                self._remove(entries, by_user, token_hash)
+            if user_id is not None:
+                for key in list(by_user.get(user_id, ())):
+                    self._remove(entries, by_user, key)
+
+
+local_cache = LocalTokenCache('access_tokens')
+
+
+def invalidate_token(token):
+    token_hash = hash_token(token)
+    local_cache.discard(token_hash=token_hash)
+    cache.delete(_token_key(token_hash))
+
+
+def invalidate_user(user_id):
+    local_cache.discard(user_id=user_id)
+    cache.delete(_user_key(user_id))
+
+
+def _store(access_token):
+    """Cache a valid AccessToken; return a (CachedAccessToken, user) tuple."""
+    cached = CachedAccessToken.from_model(access_token)
+    user = access_token.user
+    timeout = min(int((cached.expires - timezone.now()).total_seconds()),
+                  settings.ACCESS_TOKEN_CACHE_TIMEOUT)
+    if timeout > 0:
+        token_hash = hash_token(access_token.token)
+        cache.set_many({
+            _token_key(token_hash): cached.to_dict(),
+            _user_key(user.pk): user,
+        }, timeout)
+        local_cache.set(token_hash, cached, user)
+    return cached, user
+
+
+def lookup_tokens(tokens):
+    """
+    Return a dict of token -> (CachedAccessToken, user) for those of
+    `tokens` that exist, have not expired and whose application still
+    exists.
+
+    Tokens are looked up from the local cache, then the shared cache
+    and finally the database, each with a single round trip.
+    """
+    found = {}
+    hashes = {}
+    for token in set(tokens):
+        token_hash = hash_token(token)
+        entry = local_cache.get(token_hash)
+        if entry is not None:
+            found[token] = entry
+        else:
+            hashes[token] = token_hash
+
+    if hashes:
+        data = cache.get_many([_token_key(token_hash) for token_hash in hashes.values()])
+        data = {token: data[_token_key(token_hash)] for token, token_hash in hashes.items()
+                if _token_key(token_hash) in data}
+        user_ids = set(entry['user_id'] for entry in data.values())
+        cached_users = cache.get_many([_user_key(user_id) for user_id in user_ids])
+        users = {user_id: cached_users[_user_key(user_id)] for user_id in user_ids
+                 if _user_key(user_id) in cached_users}
+        missing = user_ids - set(users)
+        if missing:
+            fetched = {user.pk: user for user in get_user_model().objects.filter(pk__in=missing)}
+            cache.set_many({_user_key(pk): user for pk, user in fetched.items()},
+                           settings.ACCESS_TOKEN_CACHE_TIMEOUT)
+            users.update(fetched)
+        for token, entry in data.items():
+            if entry['user_id'] in users:
+                access_token = CachedAccessToken(token, **entry)
+                user = users[entry['user_id']]
+                local_cache.set(hashes[token], access_token, user)
+                found[token] = access_token, user
+
+    hits.inc(len(found))
+    unknown = [token for token in hashes if token not in found]
+    if unknown:
+        misses.inc(len(unknown))
+        queryset = AccessToken.objects.filter(token__in=unknown).select_related('user', 'application')
+        for access_token in queryset:
+            if access_token.user is not None and not access_token.is_expired():
+                found[access_token.token] = _store(access_token)
+
+    return {token: entry for token, entry in found.items()
+            if not entry[0].is_expired() and entry[0].application is not None}
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    OAuth2Authentication that serves bearer tokens in the Authorization
+    header from the cache.
+
+    `request.auth` is a CachedAccessToken instead of an AccessToken.
+    Tokens passed any other way are handled by Django OAuth Toolkit as
+    before.
+    """
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b'bearer':
+            return super(CachedOAuth2Authentication, self).authenticate(request)
+        try:
+            token = auth[1].decode('ascii')
+        except UnicodeError:
+            return None
+
+        entry = lookup_tokens([token]).get(token)
+        if entry is None:
+            return None
+        access_token, user = entry
+        # The user may be shared with other requests through the local cache
+        return copy.copy(user), access_token
+
+
+class ClientCredentialsAuthentication(BaseAuthentication):
+    """
+    Authenticate an OAuth2 client with its client id and secret in HTTP
+    Basic auth, as in RFC 6749 section 2.3.1.
+
+    `request.auth` is the Application and `request.user` is anonymous.
+    """
+    www_authenticate_realm = 'api'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b'basic':
+            return None
+        try:
+            decoded = base64.b64decode(auth[1]).decode('utf8')
+        except (TypeError, ValueError):
+            raise exceptions.AuthenticationFailed("Invalid basic header")
+        client_id, sep, client_secret = decoded.partition(':')
+        client_id, client_secret = unquote_plus(client_id), unquote_plus(client_secret)
+
+        app = applications.get(client_id)
+        if app is None or not sep or not constant_time_compare(app.client_secret, client_secret):
+            raise exceptions.AuthenticationFailed("Invalid client credentials")
+        return AnonymousUser(), app
+
+    def authenticate_header(self, request):
+        return 'Basic realm="%s"' % self.www_authenticate_realm
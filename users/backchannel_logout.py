@@ -0,0 +1,114 @@
+"""
+OpenID Connect back-channel logout.
+
+The applications that a session authorized are recorded in the session
+next to its login methods. When the user logs out, each of them that
+has a `backchannel_logout_uri` is sent a signed logout token. The
+tokens are POSTed in parallel by a shared pool of
+BACKCHANNEL_LOGOUT_CONCURRENCY threads, and the logout waits for them
+for at most BACKCHANNEL_LOGOUT_TIMEOUT seconds in total, however many
+applications there are. Deliveries still running then are left to
+finish in the background, each within BACKCHANNEL_LOGOUT_REQUEST_TIMEOUT
+seconds.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+
+from hkijwt.keys import sign_jwt
+
+from .applications import applications
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'logout_clients'
+LOGOUT_EVENT = 'http://schemas.openid.net/event/backchannel-logout'
+
+
+def remember_client(session, client_id):
+    clients = session.get(SESSION_KEY, [])
+    if client_id not in clients:
+        session[SESSION_KEY] = clients + [client_id]
+
+
+def get_session_applications(session):
+    """Return the applications authorized in the session."""
+    apps = (applications.get(client_id) for client_id in session.get(SESSION_KEY, []))
+    return [app for app in apps if app is not None]
+
+
+def get_applications(session):
+    """Return the applications of the session that take logout tokens."""
+    return [app for app in get_session_applications(session) if app.backchannel_logout_uri]
+
+
+def create_logout_token(user, application):
+    now = int(time.time())
+    payload = {
+        'iss': settings.JWT_ISSUER,
+        'aud': application.client_id,
+        'sub': str(user.uuid),
+        'iat': now,
+        'exp': now + 120,
+        'jti': uuid.uuid4().hex,
+        'events': {LOGOUT_EVENT: {}},
+    }
+    return sign_jwt(payload, application.client_secret)
+
+
+def post_logout_token(url, token, timeout):
+    try:
+        response = requests.post(url, data={'logout_token': token}, timeout=timeout,
+                                 headers={'Cache-Control': 'no-store'})
+    except requests.RequestException as e:
+        logger.warning("Back-channel logout to %s failed: %s", url, e)
+        return False
+    if response.status_code != 200:
+        logger.warning("Back-channel logout to %s failed: HTTP %d", url, response.status_code)
+        return False
+    return True
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.BACKCHANNEL_LOGOUT_CONCURRENCY)
+        return _executor
+
+
+def notify(user, apps):
+    """
+    Send logout tokens for `user` to `apps`. Return {client_id: result}
+    where result is True or False, or None when the delivery did not
+    finish within BACKCHANNEL_LOGOUT_TIMEOUT.
+    """
+    if not apps:
+        return {}
+    executor = get_executor()
+    results = {}
+    futures = {}
+    for app in apps:
+        try:
+            token = create_logout_token(user, app)
+        except Exception:
+            # The user is logged out regardless
+            logger.exception("Cannot sign a logout token for %s", app.client_id)
+            results[app.client_id] = False
+            continue
+        futures[app.client_id] = executor.submit(
+            post_logout_token, app.backchannel_logout_uri, token,
+            settings.BACKCHANNEL_LOGOUT_REQUEST_TIMEOUT)
+    wait(futures.values(), settings.BACKCHANNEL_LOGOUT_TIMEOUT)
+    results.update((client_id, future.result() if future.done() else None)
+                   for client_id, future in futures.items())
+    return results
@@ -0,0 +1,121 @@
+"""
+Benchmark scenarios for the hot SSO endpoints.
+
+Used by the `benchmark_endpoints` management command for latency
+percentiles and by the test suite to catch query count regressions.
+The data they run against comes from `users.testing`.
+"""
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .testing import bearer
+
+# Maximum number of database queries per request, in the steady state
+QUERY_BUDGETS = {
+    'user': 1,
+    'user_detail': 2,
+    'jwt_token': 1,
+    'login': 0,
+    'adfs_callback': 20,
+    # Includes the change feed entry (and its BEGIN outside tests) of the new user
+    'adfs_signup': 30,
+}
+
+
+class Scenario(object):
+    """
+    A request to benchmark.
+
+    `prepare(client, i)` does any unmeasured setup for iteration `i`
+    and returns a callable that performs the measured request.
+    """
+    def __init__(self, name, prepare, expected_status=200):
+        self.name = name
+        self.prepare = prepare
+        self.expected_status = expected_status
+        self.client = Client()
+
+    @property
+    def query_budget(self):
+        return QUERY_BUDGETS[self.name]
+
+    def run(self, iterations):
+        result = ScenarioResult(self)
+        for i in range(iterations):
+            request = self.prepare(self.client, i)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = request()
+                elapsed = time.perf_counter() - start
+            if response.status_code != self.expected_status:
+                raise AssertionError("%s: unexpected status %d" % (self.name, response.status_code))
+            result.add(elapsed, len(queries))
+        return result
+
+
+class ScenarioResult(object):
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.latencies = []
+        self.query_counts = []
+
+    def add(self, elapsed, query_count):
+        self.latencies.append(elapsed)
+        self.query_counts.append(query_count)
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))
+        return latencies[index]
+
+    @property
+    def max_queries(self):
+        # The first request may fill process-local caches, so it does not
+        # count against the steady state budget unless it is the only one.
+        counts = self.query_counts[1:] or self.query_counts
+        return max(counts)
+
+    @property
+    def over_budget(self):
+        return self.max_queries > self.scenario.query_budget
+
+
+def get_scenarios(data, adfs):
+    users = data.users
+
+    def user(client, i):
+        return lambda: client.get('/user/', **bearer('bench-user-%d' % (i % len(users))))
+
+    def user_detail(client, i):
+        username = users[i % len(users)].username
+        return lambda: client.get('/user/%s/' % username, **bearer('bench-admin'))
+
+    def jwt_token(client, i):
+        return lambda: client.get('/jwt-token/?target_app=bench-target',
+                                  **bearer('bench-user-%d' % (i % len(users))))
+
+    def login(client, i):
+        return lambda: client.get('/login/', {'next': '/oauth2/authorize/?client_id=bench-app'})
+
+    def adfs_callback(client, i):
+        identity = i % len(users)
+        if identity not in adfs.seen:
+            # The first login of an identity is a signup
+            adfs.login(client, identity)()
+            adfs.seen.add(identity)
+        return adfs.login(client, identity)
+
+    def adfs_signup(client, i):
+        return adfs.login(client, 'new-%d' % next(adfs.signups))
+
+    return [
+        Scenario('user', user),
+        Scenario('user_detail', user_detail),
+        Scenario('jwt_token', jwt_token),
+        Scenario('login', login),
+        Scenario('adfs_callback', adfs_callback, expected_status=302),
+        Scenario('adfs_signup', adfs_signup, expected_status=302),
+    ]
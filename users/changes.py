@@ -0,0 +1,99 @@
+"""
+Change feed of users for directory replicas.
+
+Every save or delete of a user that may touch the replicated fields
+appends a UserChange. Replicas read the changes after the last sequence
+number they have seen, together with the current state of the changed
+users. Compaction drops old entries that a newer entry of the same user
+supersedes, so the log stays proportional to the number of users.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.utils import timezone
+
+from .listing import format_row
+from .models import UserChange
+
+FIELDS = ('uuid', 'username', 'email', 'first_name', 'last_name', 'department_name',
+          'is_active', 'modified_at', 'display_name')
+
+
+def is_relevant_save(update_fields):
+    """Return False for saves that cannot have changed the replicated fields."""
+    return update_fields is None or bool(set(update_fields) & set(FIELDS))
+
+
+def record(users, deleted=False):
+    UserChange.objects.bulk_create(
+        [UserChange(user_id=user.pk, uuid=user.uuid, deleted=deleted) for user in users])
+
+
+def get_changes(since=0, limit=1000):
+    """
+    Return (changes, last_seq, more) for up to `limit` changes after
+    sequence number `since`, one per user with the user's current state.
+    `more` is True if the limit was reached.
+
+    Changes younger than USER_CHANGE_FEED_LAG seconds are left out, so
+    that entries from transactions that commit out of sequence order
+    are not skipped. The lag is measured from `created_at`, which is
+    set when the entry is written, not when it commits: an entry written
+    in a transaction that stays open longer than the lag can commit
+    below a sequence number a replica has already passed, and that
+    replica never sees it. Keep transactions that save users shorter
+    than the lag.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.USER_CHANGE_FEED_LAG)
+    entries = list(UserChange.objects.filter(id__gt=since, created_at__lte=cutoff)
+                   .order_by('id').values_list('id', 'user_id', 'uuid', 'deleted')[:limit])
+    if not entries:
+        return [], since, False
+
+    latest = {}
+    for seq, user_id, uuid, deleted in entries:
+        latest.pop(uuid, None)  # Keep the entries in the order of their latest change
+        latest[uuid] = (seq, user_id, deleted)
+    user_ids = [user_id for seq, user_id, deleted in latest.values() if not deleted]
+    columns = set(FIELDS) - {'display_name'} | {'pk', 'first_name', 'last_name'}
+    users = {values['pk']: values for values in
+             get_user_model().objects.filter(pk__in=user_ids).values(*columns)}
+
+    changes = []
+    for uuid, (seq, user_id, deleted) in latest.items():
+        values = users.get(user_id)
+        if deleted or values is None:
+            changes.append({'seq': seq, 'uuid': str(uuid), 'deleted': True})
+        else:
+            changes.append({'seq': seq, 'uuid': str(uuid), 'deleted': False,
+                            'user': format_row(values, FIELDS)})
+    return changes, entries[-1][0], len(entries) == limit
+
+
+def compact(older_than, batch_size=1000, delay=0.1):
+    """
+    Delete entries created before `older_than` that are superseded by a
+    newer entry of the same user; return the number deleted.
+    """
+    deleted = 0
+    last_seq = 0
+    while True:
+        batch = list(UserChange.objects.filter(id__gt=last_seq, created_at__lt=older_than)
+                     .order_by('id').values_list('id', 'uuid')[:batch_size])
+        if not batch:
+            break
+        # order_by() clears Meta.ordering, which would add id to the GROUP BY
+        latest = dict(UserChange.objects.filter(uuid__in=set(uuid for seq, uuid in batch))
+                      .order_by().values('uuid').annotate(latest=Max('id'))
+                      .values_list('uuid', 'latest'))
+        superseded = [seq for seq, uuid in batch if seq < latest[uuid]]
+        if superseded:
+            deleted += UserChange.objects.filter(id__in=superseded).delete()[0]
+        last_seq = batch[-1][0]
+        if len(batch) < batch_size:
+            break
+        time.sleep(delay)
+    return deleted
@@ -0,0 +1,129 @@
+"""
+Export of all users with their social accounts.
+
+Users are read in primary key ordered chunks, and the social accounts of
+each chunk with one more query, so memory use does not grow with the
+number of users. The primary key range can be split into shards that
+separate processes export into files of their own.
+"""
+import csv
+import json
+import multiprocessing
+import os
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Max, Min
+
+from allauth.socialaccount.models import SocialAccount
+
+from .listing import format_row
+from .login_methods import login_methods
+
+FIELDS = (
+    'id', 'uuid', 'username', 'email', 'first_name', 'last_name', 'department_name',
+    'primary_sid', 'is_active', 'date_joined', 'last_login', 'modified_at',
+)
+FORMATS = ('csv', 'ndjson')
+
+
+def iter_users(start=None, end=None, chunk_size=2000):
+    """
+    Yield export rows of the users with start <= pk < end (None for no
+    limit), with their social accounts and login methods.
+    """
+    queryset = get_user_model().objects.order_by('pk')
+    if end is not None:
+        queryset = queryset.filter(pk__lt=end)
+    last_pk = None if start is None else start - 1
+    configured = set(method.provider_id for method in login_methods.get_methods())
+
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk.values(*FIELDS)[:chunk_size])
+        if not rows:
+            return
+        accounts = {}
+        for user_id, provider, uid in SocialAccount.objects.filter(
+                user_id__in=[row['id'] for row in rows]).order_by('pk').values_list(
+                'user_id', 'provider', 'uid'):
+            accounts.setdefault(user_id, []).append({'provider': provider, 'uid': uid})
+
+        for values in rows:
+            row = format_row(values, FIELDS)
+            row['social_accounts'] = accounts.get(values['id'], [])
+            row['login_methods'] = sorted(set(account['provider'] for account in row['social_accounts'])
+                                          & configured)
+            yield row
+        last_pk = rows[-1]['id']
+
+
+class CSVWriter(object):
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, FIELDS + ('social_accounts', 'login_methods'))
+        self.writer.writeheader()
+
+    def write(self, row):
+        row = dict(row)
+        row['social_accounts'] = ' '.join('%(provider)s:%(uid)s' % account
+                                          for account in row['social_accounts'])
+        row['login_methods'] = ' '.join(row['login_methods'])
+        self.writer.writerow(row)
+
+
+class NDJSONWriter(object):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row) + '\n')
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'ndjson': NDJSONWriter,
+}
+
+
+def export(stream, format, start=None, end=None, chunk_size=2000):
+    """Write users with start <= pk < end to `stream`; return the count."""
+    writer = WRITERS[format](stream)
+    count = 0
+    for row in iter_users(start, end, chunk_size):
+        writer.write(row)
+        count += 1
+    return count
+
+
+def shard_ranges(shards):
+    """Split the user primary key range into `shards` (start, end) ranges."""
+    bounds = get_user_model().objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return [(None, None)]
+    first, last = bounds['first'], bounds['last'] + 1
+    size = max(1, -(-(last - first) // shards))
+    return [(start, min(start + size, last)) for start in range(first, last, size)]
+
+
+def shard_path(path, index):
+    root, ext = os.path.splitext(path)
+    return '%s-%d%s' % (root, index, ext)
+
+
+def _export_shard(args):
+    path, format, start, end, chunk_size = args
+    with open(path, 'w', newline='', encoding='utf8') as stream:
+        return path, export(stream, format, start, end, chunk_size)
+
+
+def export_shards(path, format, shards, chunk_size=2000):
+    """
+    Export users into `shards` files in parallel worker processes.
+    Return a list of (path, count) tuples.
+    """
+    tasks = [(shard_path(path, index), format, start, end, chunk_size)
+             for index, (start, end) in enumerate(shard_ranges(shards))]
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    with multiprocessing.Pool(min(shards, len(tasks))) as pool:
+        return pool.map(_export_shard, tasks)
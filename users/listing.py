@@ -0,0 +1,105 @@
+"""
+Bulk listing of users in keyset (cursor) order.
+
+Rows are read with `values()` and formatted like UserSerializer does,
+without creating model instances. A cursor names the ordering key and
+primary key of the last row returned, so every page is a single
+indexed range query no matter how deep into the listing it is.
+"""
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+
+FIELDS = (
+    'last_login', 'username', 'email', 'date_joined', 'first_name', 'last_name',
+    'uuid', 'department_name', 'modified_at', 'display_name',
+)
+DEFAULT_FIELDS = FIELDS
+
+# Ordering name -> model field; each has an index together with the pk
+ORDERINGS = {
+    'uuid': 'uuid',
+    'date_joined': 'date_joined',
+}
+
+_datetime_field = serializers.DateTimeField()
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _columns(fields, ordering):
+    columns = set(field for field in fields if field != 'display_name')
+    if 'display_name' in fields:
+        columns.update(('first_name', 'last_name'))
+    columns.update(('pk', ORDERINGS[ordering]))
+    return columns
+
+
+def format_row(values, fields):
+    row = {}
+    for field in fields:
+        if field == 'display_name':
+            if values['first_name'] and values['last_name']:
+                row[field] = '%s %s' % (values['first_name'], values['last_name'])
+            continue
+        value = values[field]
+        if field in ('last_login', 'date_joined', 'modified_at'):
+            value = _datetime_field.to_representation(value) if value else None
+        elif field == 'uuid':
+            value = str(value)
+        row[field] = value
+    return row
+
+
+def encode_cursor(values, ordering):
+    key = values[ORDERINGS[ordering]]
+    key = key.isoformat() if ordering == 'date_joined' else str(key)
+    data = json.dumps([ordering, key, values['pk']]).encode('utf8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        cursor_ordering, key, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor("invalid cursor")
+    if cursor_ordering != ordering or not isinstance(pk, int):
+        raise InvalidCursor("cursor does not match the ordering")
+    field = get_user_model()._meta.get_field(ORDERINGS[ordering])
+    try:
+        key = field.to_python(key)
+    except Exception:
+        raise InvalidCursor("invalid cursor")
+    return key, pk
+
+
+def get_page(queryset, fields, ordering, cursor=None, limit=100):
+    """
+    Return (rows, next_cursor) for up to `limit` users after `cursor`.
+    `next_cursor` is None on the last page.
+    """
+    field = ORDERINGS[ordering]
+    if cursor is not None:
+        key, pk = decode_cursor(cursor, ordering)
+        queryset = (queryset.filter(**{field + '__gt': key}) |
+                    queryset.filter(**{field: key, 'pk__gt': pk}))
+    values = list(queryset.order_by(field, 'pk').values(*_columns(fields, ordering))[:limit + 1])
+    next_cursor = None
+    if len(values) > limit:
+        values = values[:limit]
+        next_cursor = encode_cursor(values[-1], ordering)
+    return [format_row(row, fields) for row in values], next_cursor
+
+
+def iter_rows(queryset, fields, ordering, cursor=None, chunk_size=1000):
+    """Yield all the rows after `cursor`, fetching `chunk_size` at a time."""
+    while True:
+        rows, cursor = get_page(queryset, fields, ordering, cursor, chunk_size)
+        for row in rows:
+            yield row
+        if cursor is None:
+            return
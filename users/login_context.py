@@ -0,0 +1,33 @@
+"""
+The application a login is being done for.
+
+The OAuth2 authorization view records the client id of a known
+application in the session before sending the user to log in, so
+`LoginView` and later steps of the login can read it directly instead
+of digging it out of the `next` URL.
+"""
+import time
+
+from .login_methods import login_methods
+
+SESSION_KEY = 'login_client'
+
+# A recorded application is ignored after this many seconds
+MAX_AGE = 15 * 60
+
+
+def remember_client(request, client_id):
+    if not client_id or not login_methods.has_application(client_id):
+        return
+    context = request.session.get(SESSION_KEY)
+    if context and context['client_id'] == client_id and time.time() - context['at'] < 60:
+        return  # Recent enough; avoid a session write on every request
+    request.session[SESSION_KEY] = {'client_id': client_id, 'at': time.time()}
+
+
+def get_client_id(request):
+    """Return the client id recorded in the session or None."""
+    context = request.session.get(SESSION_KEY)
+    if not context or time.time() - context['at'] > MAX_AGE:
+        return None
+    return context['client_id']
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+
+from django.core.urlresolvers import NoReverseMatch
+
+from allauth.socialaccount import providers
+
+from helsso.registry import Registry
+
+from .models import Application, LoginMethod
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_FIELDS = ('provider_id', 'name', 'background_color', 'logo_url', 'short_description')
+
+
+class ResolvedLoginMethod(object):
+    """A login method's display fields together with its login URL."""
+    def __init__(self, login_url, **fields):
+        self.login_url = login_url
+        self.__dict__.update(fields)
+
+    @classmethod
+    def from_model(cls, method, login_url):
+        return cls(login_url, **{field: getattr(method, field) for field in DISPLAY_FIELDS})
+
+    def with_next(self, next_url):
+        fields = {field: getattr(self, field) for field in DISPLAY_FIELDS}
+        return ResolvedLoginMethod(self.login_url + '?next=' + next_url, **fields)
+
+
+class LoginMethodRegistry(Registry):
+    """
+    Resolved login methods of every application, keyed by client id.
+
+    Login URLs are reversed when the registry is loaded; it is always
+    loaded during a request, so they include the script prefix.
+    """
+    def resolve(self, method):
+        if method.provider_id == 'saml':
+            return None  # SAML support removed
+        provider_cls = providers.registry.provider_map.get(method.provider_id)
+        if provider_cls is None:
+            logger.warning("Login method %s has no installed provider", method)
+            return None
+        try:
+            login_url = provider_cls(None).get_login_url(None)
+        except NoReverseMatch:
+            logger.warning("Unable to determine the login URL of %s", method)
+            return None
+        return ResolvedLoginMethod.from_model(method, login_url)
+
+    def load(self):
+        methods = []
+        by_id = {}
+        for method in LoginMethod.objects.all():
+            resolved = self.resolve(method)
+            if resolved is not None:
+                methods.append(resolved)
+                by_id[method.id] = resolved
+
+        app_methods = {client_id: set() for client_id in
+                       Application.objects.values_list('client_id', flat=True)}
+        for client_id, method_id in Application.login_methods.through.objects.values_list(
+                'application__client_id', 'loginmethod_id'):
+            if method_id in by_id:
+                app_methods[client_id].add(by_id[method_id])
+
+        by_client = {}
+        for client_id, allowed in app_methods.items():
+            by_client[client_id] = [m for m in methods if m in allowed]
+        return methods, by_client, self.compute_version(methods, by_client)
+
+    @staticmethod
+    def compute_version(methods, by_client):
+        """A hash of everything the login page is rendered from."""
+        def describe(method_list):
+            return [[m.login_url] + [getattr(m, field) for field in DISPLAY_FIELDS]
+                    for m in method_list]
+        state = [describe(methods)] + sorted([client_id, describe(method_list)]
+                                             for client_id, method_list in by_client.items())
+        return hashlib.md5(repr(state).encode('utf8')).hexdigest()
+
+    def get_methods(self, client_id=None):
+        """
+        Return the login methods of the application with `client_id`,
+        or all login methods if there is no such application.
+        """
+        methods, by_client, version = self.get_data()
+        return by_client.get(client_id, methods)
+
+    def has_application(self, client_id):
+        methods, by_client, version = self.get_data()
+        return client_id in by_client
+
+    def get_version(self, client_id=None):
+        """
+        Return a key that changes whenever the login methods returned
+        by `get_methods(client_id)` change.
+        """
+        methods, by_client, version = self.get_data()
+        return '%s:%s' % (version, client_id if client_id in by_client else '')
+
+
+login_methods = LoginMethodRegistry('login_methods')
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from users.benchmarks import get_scenarios
+from users.testing import ADFSRealmFixture, BenchmarkData
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the hot endpoints against a generated test database and "
+            "fail if any of them exceeds its query budget")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--scenario', action='append',
+                            help="Run only the named scenario; may be repeated")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Preserve the test database between runs")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, keepdb=options['keepdb'])
+        old_config = runner.setup_databases()
+        adfs = None
+        try:
+            data = BenchmarkData(options['users'])
+            data.create()
+            adfs = ADFSRealmFixture().start()
+            results = []
+            for scenario in get_scenarios(data, adfs):
+                if options['scenario'] and scenario.name not in options['scenario']:
+                    continue
+                results.append(scenario.run(options['iterations']))
+        finally:
+            if adfs is not None:
+                adfs.stop()
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        self.stdout.write('%-15s %9s %9s %9s %8s %8s' % (
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'budget'))
+        for result in results:
+            self.stdout.write('%-15s %9.2f %9.2f %9.2f %8d %8d%s' % (
+                result.scenario.name, result.percentile(50) * 1000,
+                result.percentile(95) * 1000, result.percentile(99) * 1000,
+                result.max_queries, result.scenario.query_budget,
+                '  OVER BUDGET' if result.over_budget else ''))
+
+        over = [result.scenario.name for result in results if result.over_budget]
+        if over:
+            raise CommandError("Query budget exceeded: %s" % ', '.join(over))
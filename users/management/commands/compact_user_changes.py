@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.changes import compact
+
+
+class Command(BaseCommand):
+    help = "Delete user change log entries superseded by a newer change of the same user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="Only compact entries older than this many days")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delay', type=float, default=0.1,
+                            help="Seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - datetime.timedelta(days=options['days'])
+        deleted = compact(older_than, options['batch_size'], options['delay'])
+        self.stdout.write('%d superseded changes deleted' % deleted)
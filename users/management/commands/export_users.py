@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.export import FORMATS, export, export_shards
+
+
+class Command(BaseCommand):
+    help = ("Export all users with their social accounts and login methods "
+            "as CSV or newline-delimited JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', '-o',
+                            help="Output file; standard output if not given")
+        parser.add_argument('--shards', type=int, default=1,
+                            help="Export primary key ranges in this many parallel processes, "
+                                 "each into a file of its own named after --output")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if options['shards'] > 1:
+            if not path:
+                raise CommandError("--shards requires --output")
+            for shard_path, count in export_shards(path, options['format'], options['shards'],
+                                                   options['chunk_size']):
+                self.stderr.write('%s: %d users' % (shard_path, count))
+            return
+
+        if path:
+            with open(path, 'w', newline='', encoding='utf8') as stream:
+                count = export(stream, options['format'], chunk_size=options['chunk_size'])
+        else:
+            count = export(sys.stdout, options['format'], chunk_size=options['chunk_size'])
+        self.stderr.write('%d users exported' % count)
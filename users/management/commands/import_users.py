@@ -0,0 +1,50 @@
+import csv
+import itertools
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import FIELDS, upsert_batch
+
+
+def read_rows(stream, format):
+    if format == 'csv':
+        return csv.DictReader(stream)
+    return (json.loads(line) for line in stream if line.strip())
+
+
+class Command(BaseCommand):
+    help = ("Provision users from a CSV or NDJSON file, creating new users and "
+            "updating existing ones by uuid. Columns: %s" % ', '.join(FIELDS))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = updated = failed = 0
+        start = time.perf_counter()
+        with open(options['path'], newline='', encoding='utf8') as stream:
+            rows = read_rows(stream, options['format'])
+            first_row = 1
+            while True:
+                try:
+                    batch = list(itertools.islice(rows, options['batch_size']))
+                except ValueError as e:
+                    raise CommandError("Unable to parse input: %s" % e)
+                if not batch:
+                    break
+                result = upsert_batch(batch, first_row=first_row)
+                for number, message in result.errors:
+                    self.stderr.write('row %d: %s' % (number, message))
+                created += result.created
+                updated += result.updated
+                failed += len(result.errors)
+                first_row += len(batch)
+
+        elapsed = time.perf_counter() - start
+        total = created + updated
+        self.stdout.write('%d created, %d updated, %d failed in %.1f s (%.0f users/s)' % (
+            created, updated, failed, elapsed, total / elapsed if elapsed else 0))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.reaper import reap
+
+
+class Command(BaseCommand):
+    help = ("Delete expired access tokens, refresh tokens, grants and sessions "
+            "in small batches")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.REAPER_BATCH_SIZE)
+        parser.add_argument('--delay', type=float, default=settings.REAPER_BATCH_DELAY,
+                            help="Seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        counts = reap(options['batch_size'], options['delay'])
+        for name, count in counts.items():
+            self.stdout.write('%-15s %8d deleted' % (name, count))
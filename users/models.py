@@ -10,6 +10,10 @@ from oauth2_provider.models import AbstractApplication
 
 class User(AbstractUser):
     primary_sid = models.CharField(max_length=100, unique=True)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        index_together = [('date_joined', 'id')]
 
     def save(self, *args, **kwargs):
         if not self.primary_sid:
@@ -49,6 +53,24 @@ class Application(AbstractApplication):
     site_type = models.CharField(max_length=20, choices=SITE_TYPES, null=True,
                                  verbose_name='Site type')
     login_methods = models.ManyToManyField(LoginMethod)
+    backchannel_logout_uri = models.URLField(
+        max_length=500, blank=True, verbose_name='Back-channel logout URI',
+        help_text='Receives an OpenID Connect logout token when a user logs out')
 
     class Meta:
         ordering = ('site_type', 'name')
+
+
+class UserChange(models.Model):
+    """
+    Append-only log of changes to users; the id is the sequence number
+    of the change feed.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user_id = models.IntegerField()
+    uuid = models.UUIDField(db_index=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ('id',)
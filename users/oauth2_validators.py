@@ -0,0 +1,18 @@
+import logging
+
+from oauth2_provider.oauth2_validators import OAuth2Validator as BaseOAuth2Validator
+
+from .applications import applications
+
+log = logging.getLogger(__name__)
+
+
+class OAuth2Validator(BaseOAuth2Validator):
+    """OAuth2 validator that looks applications up from the application cache."""
+    def _load_application(self, client_id, request):
+        assert hasattr(request, "client"), "'request' instance has no 'client' attribute"
+
+        request.client = request.client or applications.get(client_id)
+        if request.client is None:
+            log.debug("Application %s does not exist" % client_id)
+        return request.client
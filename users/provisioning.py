@@ -0,0 +1,221 @@
+"""
+Bulk provisioning of users ahead of their first ADFS login.
+
+Rows are validated and normalized the way an ADFS login would store
+them: the uuid is derived from `primary_sid` like the ADFS adapter does,
+so `SocialAccountAdapter.populate_user` finds the provisioned user by
+uuid on the first login. Users are upserted by uuid in batches; on
+PostgreSQL with a single INSERT ... ON CONFLICT statement per batch,
+elsewhere with one bulk_create and per-user updates.
+"""
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from adfs_provider.attributes import LOWERCASE_ATTRIBUTES, generate_uuid
+from helusers.utils import uuid_to_username
+from hkijwt import cache as jwt_cache
+from webhooks.outbox import publish_user_events
+
+from . import authentication
+from .models import UserChange
+
+FIELDS = ('primary_sid', 'uuid', 'username', 'email', 'first_name', 'last_name', 'department_name')
+# Fields that are updated on existing users when given in the input row
+UPDATE_FIELDS = ('username', 'email', 'first_name', 'last_name', 'department_name')
+
+
+class RowError(ValueError):
+    pass
+
+
+def clean_row(row):
+    """Return a validated and normalized copy of an input row."""
+    unknown = set(key for key, value in row.items() if value) - set(FIELDS)
+    if unknown:
+        raise RowError("unknown fields: %s" % ', '.join(sorted(unknown)))
+    for field in FIELDS:
+        if not isinstance(row.get(field) or '', str):
+            raise RowError("%s must be a string" % field)
+    cleaned = {field: (row.get(field) or '').strip() for field in FIELDS}
+    for field in LOWERCASE_ATTRIBUTES:
+        if field in cleaned:
+            cleaned[field] = cleaned[field].lower()
+
+    if not cleaned['primary_sid']:
+        raise RowError("primary_sid is required")
+    derived = generate_uuid(cleaned['primary_sid'])
+    if cleaned['uuid']:
+        try:
+            given = uuid.UUID(cleaned['uuid']).hex
+        except ValueError:
+            raise RowError("invalid uuid")
+        if given != derived:
+            raise RowError("uuid does not match primary_sid")
+    cleaned['uuid'] = uuid.UUID(derived)
+
+    if cleaned['email']:
+        try:
+            validate_email(cleaned['email'])
+        except ValidationError:
+            raise RowError("invalid email")
+    if not cleaned['username']:
+        cleaned['username'] = uuid_to_username(cleaned['uuid'])
+    if not cleaned['department_name']:
+        cleaned['department_name'] = None
+    return cleaned
+
+
+class BatchResult(object):
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (row number, message)
+
+
+def find_conflicts(rows):
+    """
+    Return {index: message} for rows whose username or primary_sid is
+    taken by another user, in the database or earlier in `rows`.
+    """
+    conflicts = {}
+    seen = {}
+    for index, row in enumerate(rows):
+        for field in ('uuid', 'username', 'primary_sid'):
+            key = (field, row[field])
+            if key in seen:
+                conflicts[index] = "duplicate %s in input" % field
+            seen.setdefault(key, index)
+
+    query = Q(username__in=[row['username'] for row in rows]) | Q(
+        primary_sid__in=[row['primary_sid'] for row in rows])
+    owners = {}
+    for username, primary_sid, user_uuid in get_user_model().objects.filter(query).values_list(
+            'username', 'primary_sid', 'uuid'):
+        owners[('username', username)] = user_uuid
+        owners[('primary_sid', primary_sid)] = user_uuid
+    for index, row in enumerate(rows):
+        for field in ('username', 'primary_sid'):
+            owner = owners.get((field, row[field]))
+            if owner is not None and owner != row['uuid']:
+                conflicts.setdefault(index, "%s is taken by another user" % field)
+    return conflicts
+
+
+def _new_user(row, now):
+    user = get_user_model()(date_joined=now, **row)
+    user.set_unusable_password()
+    return user
+
+
+def _upsert_postgresql(rows, update_fields):
+    """Insert or update `rows`; return a list of (id, uuid, created) tuples."""
+    User = get_user_model()
+    now = timezone.now()
+    fields = [field for field in User._meta.local_concrete_fields if not field.primary_key]
+    columns = [field.column for field in fields]
+    params = []
+    for row in rows:
+        user = _new_user(row, now)
+        params.extend(field.get_db_prep_save(field.pre_save(user, True), connection)
+                      for field in fields)
+
+    quote = connection.ops.quote_name
+    row_placeholder = '(%s)' % ', '.join(['%s'] * len(columns))
+    updates = [quote(User._meta.get_field(name).column) for name in update_fields]
+    updates.append(quote(User._meta.get_field('modified_at').column))
+    sql = 'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s RETURNING %s, %s, (xmax = 0)' % (
+        quote(User._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join([row_placeholder] * len(rows)),
+        quote(User._meta.get_field('uuid').column),
+        ', '.join('%s = EXCLUDED.%s' % (column, column) for column in updates),
+        quote(User._meta.pk.column),
+        quote(User._meta.get_field('uuid').column),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _upsert_generic(rows, update_fields):
+    User = get_user_model()
+    now = timezone.now()
+    existing = dict(User.objects.filter(uuid__in=[row['uuid'] for row in rows]).values_list('uuid', 'id'))
+    new = [_new_user(row, now) for row in rows if row['uuid'] not in existing]
+    User.objects.bulk_create(new)
+    results = []
+    for row in rows:
+        user_id = existing.get(row['uuid'])
+        if user_id is not None:
+            values = {field: row[field] for field in update_fields}
+            User.objects.filter(pk=user_id).update(modified_at=now, **values)
+            results.append((user_id, row['uuid'], False))
+    # bulk_create() does not return primary keys outside PostgreSQL
+    created = User.objects.filter(uuid__in=[user.uuid for user in new]).values_list('id', 'uuid')
+    results.extend((user_id, user_uuid, True) for user_id, user_uuid in created)
+    return results
+
+
+def given_fields(row):
+    return tuple(field for field in UPDATE_FIELDS if (row.get(field) or '').strip())
+
+
+def upsert_batch(rows, first_row=1):
+    """
+    Validate and upsert a batch of input rows by uuid. Invalid rows are
+    skipped and reported in the result with their 1-based row numbers.
+
+    Bulk writes do not send post_save, so the cache invalidation, change
+    log entries and webhook events that its handlers would do are done
+    here.
+
+    Existing users get the UPDATE_FIELDS that their row gives a value
+    for updated. Rows that give the same fields are upserted together.
+    """
+    result = BatchResult()
+    cleaned = []
+    numbers = []
+    for number, row in enumerate(rows, first_row):
+        try:
+            cleaned.append((clean_row(row), given_fields(row)))
+            numbers.append(number)
+        except RowError as e:
+            result.errors.append((number, str(e)))
+    if not cleaned:
+        return result
+
+    conflicts = find_conflicts([row for row, fields in cleaned])
+    for index, message in sorted(conflicts.items()):
+        result.errors.append((numbers[index], message))
+    groups = {}
+    for index, (row, fields) in enumerate(cleaned):
+        if index not in conflicts:
+            groups.setdefault(fields, []).append(row)
+
+    results = []
+    with transaction.atomic():
+        for update_fields, group in groups.items():
+            if connection.vendor == 'postgresql':
+                results += _upsert_postgresql(group, update_fields)
+            else:
+                results += _upsert_generic(group, update_fields)
+        UserChange.objects.bulk_create([UserChange(user_id=user_id, uuid=user_uuid)
+                                        for user_id, user_uuid, created in results])
+        publish_user_events('user.updated', get_user_model().objects.filter(
+            pk__in=[user_id for user_id, user_uuid, created in results]).only('uuid', 'username'))
+
+    for user_id, user_uuid, created in results:
+        if created:
+            result.created += 1
+        else:
+            result.updated += 1
+            jwt_cache.invalidate_user(user_id)
+            authentication.invalidate_user(user_id)
+    result.errors.sort()
+    return result
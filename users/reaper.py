@@ -0,0 +1,119 @@
+"""
+Deletion of expired OAuth2 tokens and grants and expired sessions.
+
+Rows are deleted in small primary key ordered batches with a pause in
+between, so that no single statement holds locks for long. Run it with
+the `reap_expired` management command, or set REAPER_INTERVAL to have
+each web process run it in a background thread; a cache lock makes
+sure only one process reaps per interval.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connection
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Grant, RefreshToken
+from oauth2_provider.settings import oauth2_settings
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'users:reaper'
+
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+def delete_in_batches(queryset, batch_size, delay):
+    """Delete the rows of `queryset` in batches; return the number deleted."""
+    deleted = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        queryset.model._base_manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        last_pk = pks[-1]
+        if len(pks) < batch_size:
+            break
+        time.sleep(delay)
+    return deleted
+
+
+def get_expired_querysets(now):
+    """
+    Return the expired rows to delete, in order, with the same rules as
+    Django OAuth Toolkit's clear_expired(): refresh tokens expire only
+    if REFRESH_TOKEN_EXPIRE_SECONDS is set, and an access token is kept
+    as long as it has a refresh token.
+    """
+    querysets = OrderedDict()
+    refresh_expire_seconds = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+    if refresh_expire_seconds:
+        if not isinstance(refresh_expire_seconds, timedelta):
+            refresh_expire_seconds = timedelta(seconds=refresh_expire_seconds)
+        querysets['refresh tokens'] = RefreshToken.objects.filter(
+            access_token__expires__lt=now - refresh_expire_seconds)
+    querysets['access tokens'] = AccessToken.objects.filter(
+        refresh_token__isnull=True, expires__lt=now)
+    querysets['grants'] = Grant.objects.filter(expires__lt=now)
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        querysets['sessions'] = Session.objects.filter(expire_date__lt=now)
+    return querysets
+
+
+def reap(batch_size=None, delay=None):
+    """Delete all expired rows; return an OrderedDict of counts."""
+    if batch_size is None:
+        batch_size = settings.REAPER_BATCH_SIZE
+    if delay is None:
+        delay = settings.REAPER_BATCH_DELAY
+    counts = OrderedDict()
+    for name, queryset in get_expired_querysets(timezone.now()).items():
+        counts[name] = delete_in_batches(queryset, batch_size, delay)
+    return counts
+
+
+class BackgroundReaper(threading.Thread):
+    def __init__(self, interval):
+        super(BackgroundReaper, self).__init__(name='reaper', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if cache.add(LOCK_KEY, True, self.interval):
+                    counts = reap()
+                    logger.info("Reaped expired rows: %s",
+                                ', '.join('%d %s' % (count, name) for name, count in counts.items()))
+            except Exception:
+                logger.exception("Reaping expired rows failed")
+            finally:
+                connection.close()
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def start_background_reaper(**kwargs):
+    """Start the background reaper once; connected to request_started."""
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = BackgroundReaper(settings.REAPER_INTERVAL)
+            _reaper.start()
+    request_started.disconnect(start_background_reaper)
@@ -1,6 +1,13 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from allauth.account.signals import user_logged_in as allauth_user_logged_in
 from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from . import authentication, changes
+from .applications import applications
+from .login_methods import login_methods
+from .models import Application, LoginMethod, User
 
 
 @receiver(allauth_user_logged_in)
@@ -20,3 +27,36 @@ def handle_allauth_login(sender, request, user, **kwargs):
         request.session.set_expiry(delta.total_seconds())
     else:
         request.session.set_expiry(3600)
+
+
+@receiver(post_save, sender=LoginMethod)
+@receiver(post_delete, sender=LoginMethod)
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(m2m_changed, sender=Application.login_methods.through)
+def invalidate_login_methods(sender, **kwargs):
+    login_methods.invalidate()
+    applications.invalidate()
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def invalidate_access_token(sender, instance, **kwargs):
+    authentication.invalidate_token(instance.token)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_token_user(sender, instance, **kwargs):
+    authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def record_user_save(sender, instance, update_fields=None, **kwargs):
+    if changes.is_relevant_save(update_fields):
+        changes.record([instance])
+
+
+@receiver(post_delete, sender=User)
+def record_user_delete(sender, instance, **kwargs):
+    changes.record([instance], deleted=True)
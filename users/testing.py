@@ -0,0 +1,123 @@
+"""
+Generated test data and test case mixins shared by the test suites and
+the `benchmark_endpoints` management command.
+"""
+import datetime
+import itertools
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from allauth.socialaccount.models import SocialApp
+from oauth2_provider.models import AccessToken
+
+from adfs_provider.models import ADFSRealm
+from adfs_provider.testing import FakeADFSServer
+from helsso.registry import invalidate_all
+from hkijwt.models import AppToAppPermission
+
+from .models import Application, LoginMethod, User
+
+
+class BenchmarkData(object):
+    """Generated users, applications and access tokens."""
+    def __init__(self, user_count=100):
+        self.user_count = user_count
+
+    def create(self):
+        expires = timezone.now() + datetime.timedelta(hours=1)
+        for order, provider_id in enumerate(('facebook', 'github', 'google')):
+            LoginMethod.objects.create(provider_id=provider_id, name=provider_id.title(), order=order)
+
+        self.admin = User.objects.create(username='bench-admin', email='admin@bench.invalid',
+                                         is_superuser=True)
+        self.app = Application.objects.create(
+            user=self.admin, name='Benchmark', client_id='bench-app',
+            client_type='confidential', authorization_grant_type='authorization-code')
+        self.app.login_methods = LoginMethod.objects.all()
+        self.target_app = Application.objects.create(
+            user=self.admin, name='Benchmark target', client_id='bench-target',
+            client_type='confidential', authorization_grant_type='authorization-code')
+        AppToAppPermission.objects.create(requester=self.app, target=self.target_app)
+
+        AccessToken.objects.create(user=self.admin, application=self.app, token='bench-admin',
+                                   scope='read write', expires=expires)
+        self.users = []
+        for i in range(self.user_count):
+            user = User.objects.create(username='bench-user-%d' % i, email='user%d@bench.invalid' % i,
+                                       first_name='User', last_name=str(i), primary_sid='bench-%d' % i)
+            AccessToken.objects.create(user=user, application=self.app, token='bench-user-%d' % i,
+                                       scope='read write', expires=expires)
+            self.users.append(user)
+
+
+class ADFSRealmFixture(object):
+    """An ADFS realm backed by a local fake token endpoint."""
+    realm_name = 'bench'
+
+    def __init__(self):
+        self.claims = {}
+        self.server = FakeADFSServer(lambda: self.claims)
+        self.signups = itertools.count()
+        self.seen = set()
+
+    def start(self):
+        self.server.start()
+        app = SocialApp.objects.create(provider='adfs', name='bench', client_id='bench', secret='bench')
+        ADFSRealm.objects.create(app=app, name=self.realm_name, adfs_url=self.server.adfs_url,
+                                 certificate=self.server.certificate)
+        return self
+
+    def stop(self):
+        self.server.stop()
+
+    def login(self, client, identity):
+        """
+        Start an ADFS login as `identity` and return a callable that
+        completes it by calling the callback view.
+        """
+        self.claims = {
+            'primarysid': 'S-1-5-21-bench-%s' % identity,
+            'email': 'adfs-%s@bench.invalid' % identity,
+            'winaccountname': 'adfs-%s' % identity,
+            'given_name': 'Adfs',
+            'family_name': str(identity),
+            'Company': 'BENCH',
+        }
+        client.logout()
+        response = client.get('/accounts/adfs/%s/login/' % self.realm_name)
+        state = parse_qs(urlparse(response['Location']).query)['state'][0]
+        return lambda: client.get('/accounts/adfs/%s/login/callback/' % self.realm_name,
+                                  {'code': 'bench', 'state': state})
+
+
+def bearer(token):
+    return {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+
+
+
+class CleanCachesMixin(object):
+    """Start each test with an empty cache backend and fresh registries."""
+    def setUp(self):
+        super(CleanCachesMixin, self).setUp()
+        cache.clear()
+        invalidate_all()
+
+
+class BenchmarkDataMixin(CleanCachesMixin):
+    """Create BenchmarkData with `user_count` users as `self.data`."""
+    user_count = 1
+
+    def setUp(self):
+        super(BenchmarkDataMixin, self).setUp()
+        self.data = BenchmarkData(user_count=self.user_count)
+        self.data.create()
+
+
+class ADFSRealmMixin(CleanCachesMixin):
+    """Configure an ADFS realm backed by a fake server as `self.adfs`."""
+    def setUp(self):
+        super(ADFSRealmMixin, self).setUp()
+        self.adfs = ADFSRealmFixture().start()
+        self.addCleanup(self.adfs.stop)
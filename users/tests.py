@@ -1,3 +1,548 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import parse_qs
 
-# Create your tests here.
+import jwt
+import requests
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.core.urlresolvers import resolve
+from django.db import connection
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Grant, RefreshToken
+
+from adfs_provider.attributes import generate_uuid
+from helsso import metrics
+from helsso.http import RequestsProxy
+from helsso.registry import Registry, check_shared_cache
+from hkijwt.models import AppToAppPermission
+from webhooks.models import Endpoint
+from webhooks.testing import WebhookReceiver
+
+from . import authentication, backchannel_logout
+from .applications import applications
+from .benchmarks import get_scenarios
+from .changes import compact
+from .export import export, export_shards
+from .login_methods import login_methods
+from .models import LoginMethod, User, UserChange
+from .provisioning import upsert_batch
+from .reaper import reap
+from .testing import ADFSRealmMixin, BenchmarkData, BenchmarkDataMixin, CleanCachesMixin, bearer
+
+
+class QueryBudgetTests(ADFSRealmMixin, BenchmarkDataMixin, TestCase):
+    """Fail when a hot endpoint starts doing more queries than budgeted."""
+    user_count = 3
+
+    def test_query_budgets(self):
+        for scenario in get_scenarios(self.data, self.adfs):
+            with self.subTest(scenario=scenario.name):
+                result = scenario.run(3)
+                self.assertLessEqual(result.max_queries, scenario.query_budget,
+                                     "queries per request: %s" % result.query_counts)
+
+
+class LoginPageCacheTests(BenchmarkDataMixin, TestCase):
+    user_count = 0
+
+    def get(self, next_url, **extra):
+        return self.client.get('/login/', {'next': next_url}, **extra)
+
+    def test_next_is_injected_into_cached_page(self):
+        first = self.get('/oauth2/authorize/?client_id=bench-app&state=1')
+        second = self.get('/oauth2/authorize/?client_id=bench-app&state=2')
+        self.assertContains(second, 'state%3D2')
+        self.assertNotContains(second, 'state%3D1')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_same_as_uncached_page(self):
+        # Cached from an anonymous visit, then served to a logged in user
+        self.client.get('/login/')
+        user = User.objects.get(username='bench-admin')
+        self.client.force_login(user)
+        response = self.client.get('/login/')
+
+        request = RequestFactory().get('/login/')
+        request.user = user
+        baseline = TemplateResponse(request, 'login.html',
+                                    {'login_methods': login_methods.get_methods()}).render()
+        self.assertEqual(response.content.decode('utf8'), baseline.content.decode('utf8'))
+
+    def test_conditional_get(self):
+        next_url = '/oauth2/authorize/?client_id=bench-app'
+        response = self.get(next_url)
+        self.assertEqual(self.get(next_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.data.app.login_methods.remove(LoginMethod.objects.get(provider_id='github'))
+        response = self.get(next_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '/accounts/github/')
+
+
+@override_settings(MIDDLEWARE_CLASSES=('helsso.metrics.MetricsMiddleware',) + settings.MIDDLEWARE_CLASSES)
+class MetricsTests(BenchmarkDataMixin, TestCase):
+    def get_samples(self, histogram, **labels):
+        values = {}
+        for name, value in histogram.samples():
+            if all('%s="%s"' % label in name for label in labels.items()):
+                values[name.split('{')[0]] = value
+        return values
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test', "Test", ('endpoint',), buckets=(1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, endpoint='a')
+        self.assertEqual(list(histogram.samples()), [
+            ('test_bucket{endpoint="a",le="1"}', 2),
+            ('test_bucket{endpoint="a",le="5"}', 3),
+            ('test_bucket{endpoint="a",le="+Inf"}', 4),
+            ('test_sum{endpoint="a"}', 14.5),
+            ('test_count{endpoint="a"}', 4),
+        ])
+
+    def test_request_metrics(self):
+        endpoint = resolve('/user/').view_name
+        before = self.get_samples(metrics.request_queries, endpoint=endpoint)
+        log_length = len(connection.queries_log)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/user/', **bearer('bench-user-0'))
+        queries = len(context.captured_queries)
+
+        after = self.get_samples(metrics.request_queries, endpoint=endpoint)
+        self.assertEqual(after['helsso_request_queries_count'],
+                         before.get('helsso_request_queries_count', 0) + 1)
+        self.assertEqual(after['helsso_request_queries_sum'],
+                         before.get('helsso_request_queries_sum', 0) + queries)
+        self.assertIn('helsso_request_duration_seconds_count{endpoint="%s"}' % endpoint,
+                      metrics.render())
+        db = self.get_samples(metrics.phase_duration, endpoint=endpoint, phase='db')
+        self.assertGreater(db['helsso_request_phase_duration_seconds_count'], 0)
+
+        # Queries are counted without turning on the query log
+        self.client.get('/user/', **bearer('bench-user-0'))
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertEqual(len(connection.queries_log), log_length)
+
+    def test_metrics_view(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=('127.0.0.1',)):
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer x').status_code, 403)
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertContains(response, 'helsso_request_duration_seconds')
+
+    def test_login_phases(self):
+        self.client.get('/login/')
+        endpoint = resolve('/login/').view_name
+        for phase in ('login_methods', 'template', 'db'):
+            samples = self.get_samples(metrics.phase_duration, endpoint=endpoint, phase=phase)
+            self.assertGreater(samples['helsso_request_phase_duration_seconds_count'], 0)
+
+
+class LoginContextTests(BenchmarkDataMixin, TestCase):
+    user_count = 0
+
+    def setUp(self):
+        super(LoginContextTests, self).setUp()
+        self.data.app.login_methods.remove(LoginMethod.objects.get(provider_id='github'))
+
+    def test_application_recorded_by_authorize_view(self):
+        response = self.client.get('/oauth2/authorize/', {'client_id': 'bench-app', 'response_type': 'code'})
+        self.assertEqual(response.status_code, 302)
+        # The application is known even though `next` does not name it
+        response = self.client.get('/login/', {'next': '/somewhere/'})
+        self.assertContains(response, '/accounts/facebook/')
+        self.assertNotContains(response, '/accounts/github/')
+
+
+class CountingRegistry(Registry):
+    loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.loads
+
+
+class RegistryTests(CleanCachesMixin, TestCase):
+    @override_settings(REGISTRY_VERSION_CHECK_INTERVAL=0)
+    def test_change_in_other_process(self):
+        registry, other = CountingRegistry('counting'), CountingRegistry('counting')
+        self.assertEqual(registry.get_data(), 1)
+        self.assertEqual(registry.get_data(), 1)
+        # The other process only shares the cache backend
+        other.invalidate()
+        self.assertEqual(registry.get_data(), 2)
+
+    def test_shared_cache_check(self):
+        with override_settings(REGISTRY_VERSION_CHECK_INTERVAL=None):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ['helsso.W001'])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ['helsso.W002'])
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache'}}
+        with override_settings(CACHES=memcached):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ApplicationCacheTests(BenchmarkDataMixin, TestCase):
+    user_count = 0
+
+    def test_cached_until_changed(self):
+        app = applications.get('bench-app')
+        self.assertEqual(app.pk, self.data.app.pk)
+        self.assertIsNone(applications.get('missing'))
+        with self.assertNumQueries(0):
+            self.assertIs(applications.get('bench-app'), app)
+            self.assertEqual(len(app.login_methods.all()), 3)
+            self.assertIsNone(applications.get('missing'))
+
+        self.data.app.name = 'Renamed'
+        self.data.app.save()
+        self.assertEqual(applications.get('bench-app').name, 'Renamed')
+
+    @override_settings(APPLICATION_CACHE_SIZE=1, APPLICATION_MISS_CACHE_SIZE=2)
+    def test_unknown_ids_do_not_evict_applications(self):
+        applications.get('bench-app')
+        for i in range(5):
+            self.assertIsNone(applications.get('missing-%d' % i))
+        with self.assertNumQueries(0):
+            applications.get('bench-app')
+            self.assertIsNone(applications.get('missing-4'))
+        with self.assertNumQueries(1):
+            self.assertIsNone(applications.get('missing-0'))
+
+    @override_settings(APPLICATION_CACHE_SIZE=1)
+    def test_size_is_bounded(self):
+        applications.get('bench-app')
+        applications.get('bench-target')
+        # Application and login methods
+        with self.assertNumQueries(2):
+            applications.get('bench-app')
+
+
+class AccessTokenCacheTests(BenchmarkDataMixin, TestCase):
+    def test_cached_token(self):
+        self.assertEqual(self.client.get('/user/', **bearer('bench-user-0')).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/user/', **bearer('bench-user-0'))
+        self.assertEqual(response.data['username'], 'bench-user-0')
+
+    def test_revoked_token(self):
+        self.assertEqual(self.client.get('/user/', **bearer('bench-user-0')).status_code, 200)
+        AccessToken.objects.get(token='bench-user-0').revoke()
+        self.assertEqual(self.client.get('/user/', **bearer('bench-user-0')).status_code, 401)
+
+    def test_scope(self):
+        AccessToken.objects.filter(token='bench-user-0').update(scope='write')
+        self.assertEqual(self.client.get('/user/', **bearer('bench-user-0')).status_code, 403)
+
+    def test_deleted_application(self):
+        # As left in the local cache of a process that did not see the delete
+        user = User.objects.get(username='bench-user-0')
+        access_token = authentication.CachedAccessToken(
+            'orphan', user.pk, 0, 'deleted-app', 'read', timezone.now() + datetime.timedelta(hours=1))
+        authentication.local_cache.set(authentication.hash_token('orphan'), access_token, user)
+        self.assertFalse(access_token.is_valid())
+        self.assertEqual(self.client.get('/user/', **bearer('orphan')).status_code, 401)
+
+    @override_settings(ACCESS_TOKEN_LOCAL_CACHE_SIZE=3)
+    def test_discard_user(self):
+        local_cache = authentication.local_cache
+        users = [User(pk=1), User(pk=2)]
+        for i, user in enumerate(users * 2):
+            local_cache.set('hash-%d' % i, None, user)
+        # The oldest entry is evicted; hash-0 is no longer indexed
+        entries, by_user = local_cache.get_data()
+        self.assertEqual(by_user, {1: {'hash-2'}, 2: {'hash-1', 'hash-3'}})
+
+        local_cache.discard(user_id=2)
+        self.assertEqual(list(entries), ['hash-2'])
+        self.assertEqual(by_user, {1: {'hash-2'}})
+        local_cache.discard(token_hash='hash-2')
+        self.assertEqual((entries, by_user), ({}, {}))
+
+
+class IntrospectionTests(BenchmarkDataMixin, TestCase):
+    user_count = 2
+
+    def setUp(self):
+        super(IntrospectionTests, self).setUp()
+        credentials = base64.b64encode(('bench-app:%s' % self.data.app.client_secret).encode('utf8'))
+        self.auth = {'HTTP_AUTHORIZATION': 'Basic %s' % credentials.decode('ascii')}
+
+    def test_requires_client_credentials(self):
+        self.assertEqual(self.client.post('/introspect/', {'token': 'bench-user-0'}).status_code, 401)
+        response = self.client.post('/introspect/', {'token': 'bench-user-0'},
+                                    HTTP_AUTHORIZATION='Basic %s' % base64.b64encode(b'bench-app:x').decode())
+        self.assertEqual(response.status_code, 401)
+
+    def test_introspect(self):
+        response = self.client.post('/introspect/', {'token': 'bench-user-0'}, **self.auth)
+        self.assertEqual(response.data['active'], True)
+        self.assertEqual(response.data['client_id'], 'bench-app')
+        self.assertEqual(response.data['sub'], str(self.data.users[0].uuid))
+        response = self.client.post('/introspect/', {'token': 'nope'}, **self.auth)
+        self.assertEqual(response.data, {'active': False})
+
+    def test_invalid_token(self):
+        for token in (5, ['bench-user-0'], {'token': 'bench-user-0'}):
+            response = self.client.post('/introspect/', json.dumps({'token': token}),
+                                        content_type='application/json', **self.auth)
+            self.assertEqual(response.status_code, 400)
+
+    def test_other_clients_tokens(self):
+        credentials = base64.b64encode(('bench-target:%s' % self.data.target_app.client_secret).encode('utf8'))
+        auth = {'HTTP_AUTHORIZATION': 'Basic %s' % credentials.decode('ascii')}
+        # bench-app may call bench-target, so bench-target may see its tokens
+        response = self.client.post('/introspect/', {'token': 'bench-user-0'}, **auth)
+        self.assertEqual(response.data['active'], True)
+        AppToAppPermission.objects.all().delete()
+        response = self.client.post('/introspect/', {'token': 'bench-user-0'}, **auth)
+        self.assertEqual(response.data, {'active': False})
+
+    def test_bulk(self):
+        tokens = ['bench-user-1', 'nope', 'bench-user-0']
+        # The tokens, and the client application with its login methods
+        with self.assertNumQueries(3):
+            response = self.client.post('/introspect/bulk/', {'token': tokens}, **self.auth)
+        self.assertEqual([result['active'] for result in response.data['tokens']], [True, False, True])
+        self.assertEqual(response.data['tokens'][0]['username'], 'bench-user-1')
+
+
+class ReaperTests(BenchmarkDataMixin, TestCase):
+    user_count = 3
+
+    def test_reap(self):
+        past = timezone.now() - datetime.timedelta(days=1)
+        AccessToken.objects.filter(token__in=['bench-user-0', 'bench-user-1', 'bench-user-2']).update(
+            expires=past)
+        RefreshToken.objects.create(user=self.data.users[2], application=self.data.app, token='refresh',
+                                    access_token=AccessToken.objects.get(token='bench-user-2'))
+        for i in range(3):
+            Grant.objects.create(user=self.data.admin, application=self.data.app, code='code-%d' % i,
+                                 expires=past, redirect_uri='http://localhost/')
+
+        counts = reap(batch_size=2, delay=0)
+        self.assertEqual(counts['access tokens'], 2)
+        self.assertEqual(counts['grants'], 3)
+        # The access token of a refresh token is kept
+        self.assertEqual(set(AccessToken.objects.values_list('token', flat=True)),
+                         {'bench-admin', 'bench-user-2'})
+
+
+class UserListTests(BenchmarkDataMixin, TestCase):
+    user_count = 5
+
+    def test_keyset_pages(self):
+        usernames = []
+        response = self.client.get('/users/', {'limit': 2, 'order_by': 'date_joined', 'fields': 'username'},
+                                   **bearer('bench-admin'))
+        while True:
+            usernames += [row['username'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'], **bearer('bench-admin'))
+        self.assertEqual(usernames, ['bench-admin'] + ['bench-user-%d' % i for i in range(5)])
+
+    def test_ndjson(self):
+        response = self.client.get('/users/', {'format': 'ndjson', 'fields': 'uuid,display_name'},
+                                   **bearer('bench-admin'))
+        lines = b''.join(response.streaming_content).decode('utf8').splitlines()
+        self.assertEqual(len(lines), 6)
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(sum('display_name' in row for row in rows), 5)
+        self.assertTrue(all(set(row) <= {'uuid', 'display_name'} for row in rows))
+
+    def test_superuser_only(self):
+        self.assertEqual(self.client.get('/users/', **bearer('bench-user-0')).status_code, 403)
+
+
+class ExportTests(BenchmarkDataMixin, TestCase):
+    user_count = 4
+
+    def setUp(self):
+        super(ExportTests, self).setUp()
+        user = User.objects.get(username='bench-user-0')
+        SocialAccount.objects.create(user=user, provider='github', uid='gh-0')
+        SocialAccount.objects.create(user=user, provider='twitter', uid='tw-0')
+
+    def test_ndjson(self):
+        stream = io.StringIO()
+        self.assertEqual(export(stream, 'ndjson', chunk_size=2), 5)
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([row['username'] for row in rows],
+                         ['bench-admin'] + ['bench-user-%d' % i for i in range(4)])
+        self.assertEqual(rows[1]['social_accounts'], [
+            {'provider': 'github', 'uid': 'gh-0'}, {'provider': 'twitter', 'uid': 'tw-0'}])
+        # Twitter is not configured as a login method
+        self.assertEqual(rows[1]['login_methods'], ['github'])
+        self.assertEqual(rows[2]['social_accounts'], [])
+
+    def test_csv(self):
+        stream = io.StringIO()
+        export(stream, 'csv')
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1]['username'], 'bench-user-0')
+        self.assertEqual(rows[1]['social_accounts'], 'github:gh-0 twitter:tw-0')
+        self.assertEqual(rows[1]['login_methods'], 'github')
+
+    def test_shards(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        results = export_shards(os.path.join(directory, 'users.ndjson'), 'ndjson', 2, chunk_size=2)
+        self.assertEqual([os.path.basename(path) for path, count in results],
+                         ['users-0.ndjson', 'users-1.ndjson'])
+        self.assertEqual(sum(count for path, count in results), 5)
+        usernames = []
+        for path, count in results:
+            with open(path, encoding='utf8') as stream:
+                usernames += [json.loads(line)['username'] for line in stream]
+        self.assertEqual(usernames, ['bench-admin'] + ['bench-user-%d' % i for i in range(4)])
+
+
+class ProvisioningTests(CleanCachesMixin, TestCase):
+    def test_upsert(self):
+        result = upsert_batch([
+            {'primary_sid': 'S-1-5-21-1', 'username': 'Alice', 'email': 'alice@example.com'},
+            {'primary_sid': 'S-1-5-21-2', 'email': 'not an email'},
+            {'primary_sid': 'S-1-5-21-3', 'username': 'alice'},
+        ])
+        self.assertEqual((result.created, result.updated), (1, 0))
+        self.assertEqual([number for number, message in result.errors], [2, 3])
+        user = User.objects.get(username='alice')
+        self.assertEqual(user.uuid.hex, generate_uuid('S-1-5-21-1'))
+        self.assertFalse(user.has_usable_password())
+
+        result = upsert_batch([{'primary_sid': 'S-1-5-21-1', 'department_name': 'KYMP'}])
+        self.assertEqual((result.created, result.updated), (0, 1))
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual((user.email, user.department_name), ('alice@example.com', 'kymp'))
+
+    def test_non_string_values(self):
+        result = upsert_batch([
+            {'primary_sid': 'S-1-5-21-1', 'email': 5},
+            {'primary_sid': ['S-1-5-21-2']},
+            {'primary_sid': 'S-1-5-21-3', 'first_name': None},
+        ])
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors, [(1, 'email must be a string'), (2, 'primary_sid must be a string')])
+
+    def test_webhook_events(self):
+        data = BenchmarkData(user_count=1)
+        data.create()
+        User.objects.filter(pk=data.users[0].pk).update(uuid=generate_uuid('bench-0'))
+        endpoint = Endpoint.objects.create(application=data.app, url='http://localhost/',
+                                           events='user.updated')
+        result = upsert_batch([{'primary_sid': 'bench-0', 'department_name': 'kymp'},
+                               {'primary_sid': 'S-1-5-21-1'}])
+        self.assertEqual((result.created, result.updated), (1, 1))
+        # Only the existing user has authorized the application
+        event = endpoint.deliveries.get().event
+        self.assertEqual(json.loads(event.payload)['username'], 'bench-user-0')
+
+
+@override_settings(USER_CHANGE_FEED_LAG=0)
+class UserChangeFeedTests(BenchmarkDataMixin, TestCase):
+    user_count = 2
+
+    def get_changes(self, since):
+        return self.client.get('/users/changes/', {'since': since}, **bearer('bench-admin')).data
+
+    def test_feed(self):
+        since = self.get_changes(0)['last_seq']
+        user = self.data.users[0]
+        user.department_name = 'kymp'
+        user.save()
+        user.save(update_fields=['last_login'])
+        self.data.users[1].delete()
+
+        response = self.get_changes(since)
+        self.assertEqual([(change['uuid'], change['deleted']) for change in response['changes']],
+                         [(str(user.uuid), False), (str(self.data.users[1].uuid), True)])
+        self.assertEqual(response['changes'][0]['user']['department_name'], 'kymp')
+        self.assertEqual(self.get_changes(response['last_seq'])['changes'], [])
+
+    def test_compact(self):
+        user = self.data.users[0]
+        user.save()
+        user.save()
+        latest = UserChange.objects.filter(uuid=user.uuid).latest('id')
+        self.assertEqual(compact(timezone.now() + datetime.timedelta(seconds=1), delay=0), 2)
+        self.assertEqual(list(UserChange.objects.filter(uuid=user.uuid)), [latest])
+        # Other users' only entries are kept
+        self.assertEqual(UserChange.objects.filter(uuid=self.data.users[1].uuid).count(), 1)
+
+
+class BackchannelLogoutTests(BenchmarkDataMixin, TestCase):
+    def setUp(self):
+        super(BackchannelLogoutTests, self).setUp()
+        self.receiver = WebhookReceiver().start()
+        self.addCleanup(self.receiver.stop)
+        self.data.app.backchannel_logout_uri = self.receiver.url
+        self.data.app.redirect_uris = 'http://localhost/callback'
+        self.data.app.skip_authorization = True
+        self.data.app.save()
+
+    def test_logout_token_sent(self):
+        user = self.data.users[0]
+        self.client.force_login(user)
+        response = self.client.get('/oauth2/authorize/', {
+            'client_id': 'bench-app', 'response_type': 'code',
+            'redirect_uri': 'http://localhost/callback'})
+        self.assertIn('code=', response['Location'])
+        self.client.get('/logout/')
+
+        self.assertEqual(len(self.receiver.requests), 1)
+        path, headers, body = self.receiver.requests[0]
+        token = parse_qs(body.decode('ascii'))['logout_token'][0]
+        claims = jwt.decode(token, self.data.app.client_secret, audience='bench-app')
+        self.assertEqual(claims['sub'], str(user.uuid))
+        self.assertIn(backchannel_logout.LOGOUT_EVENT, claims['events'])
+
+    @override_settings(BACKCHANNEL_LOGOUT_TIMEOUT=0.2, BACKCHANNEL_LOGOUT_REQUEST_TIMEOUT=5)
+    def test_timeout(self):
+        self.receiver.delay = 1
+        start = time.monotonic()
+        results = backchannel_logout.notify(self.data.users[0], [self.data.app])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(results, {'bench-app': None})
+
+    def test_failure(self):
+        self.receiver.statuses = [500]
+        results = backchannel_logout.notify(self.data.users[0], [self.data.app])
+        self.assertEqual(results, {'bench-app': False})
+
+    @override_settings(JWT_SIGNING_ALGORITHM='RS256')
+    def test_signing_failure(self):
+        # No RS256 signing key exists
+        self.client.force_login(self.data.users[0])
+        session = self.client.session
+        session[backchannel_logout.SESSION_KEY] = ['bench-app']
+        session.save()
+        response = self.client.get('/logout/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertEqual(self.receiver.requests, [])
+
+
+class UpstreamHTTPTests(TestCase):
+    def test_allauth_providers_use_shared_session(self):
+        from allauth.socialaccount.providers.github import views as github_views
+        from allauth.socialaccount.providers.oauth2 import client
+        self.assertIsInstance(client.requests, RequestsProxy)
+        self.assertIsInstance(github_views.requests, RequestsProxy)
+        self.assertIs(github_views.requests.RequestException, requests.RequestException)
@@ -1,62 +1,101 @@
+import hashlib
 import re
+import time
 
 from urllib.parse import urlparse, parse_qs
 
-from django.views.generic.base import TemplateView, View
-from django.core.urlresolvers import reverse
-from django.utils.http import quote
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.views.generic.base import TemplateView
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+from django.utils.http import http_date, quote, quote_etag
 from django.shortcuts import redirect
 from django.contrib.auth import logout as auth_logout
 
-from allauth.socialaccount import providers
-from oauth2_provider.models import get_application_model
+from oauth2_provider import views as oauth2_views
 
-from .models import LoginMethod
+from helsso import metrics
+
+from . import backchannel_logout, login_context
+from .login_methods import login_methods
+
+# Stands in for the quoted `next` URL in cached login pages
+NEXT_PLACEHOLDER = 'HELSSO_NEXT_URL_PLACEHOLDER'
 
 
 class LoginView(TemplateView):
+    """
+    Show the login methods of the application named in `next`.
+
+    The page is the same for every visitor of an application apart from
+    the `next` URL, so it is rendered once per application, language and
+    login method version with a placeholder for `next`, and kept in the
+    cache for LOGIN_PAGE_CACHE_TIMEOUT seconds. It is rendered with the
+    request of the first visitor, so the template must not use anything
+    of the request but its language: not `user`, `csrf_token` or
+    `messages`.
+    """
     template_name = "login.html"
 
     def get(self, request, *args, **kwargs):
         next_url = request.GET.get('next')
-        app = None
+        client_id = login_context.get_client_id(request)
         if next_url:
-            # Determine application from the 'next' query argument.
-            # FIXME: There should be a better way to get the app id.
-            params = parse_qs(urlparse(next_url).query)
-            client_id = params.get('client_id')
-            if client_id and len(client_id):
-                client_id = client_id[0].strip()
-            if client_id:
-                try:
-                    app = get_application_model().objects.get(client_id=client_id)
-                except get_application_model().DoesNotExist:
-                    pass
+            if client_id is None:
+                # Not coming from the authorization view; fall back to
+                # the client_id in the 'next' query argument.
+                params = parse_qs(urlparse(next_url).query)
+                client_id = params.get('client_id')
+                if client_id and len(client_id):
+                    client_id = client_id[0].strip()
             next_url = quote(next_url)
 
-        if app:
-            allowed_methods = app.login_methods.all()
-        else:
-            allowed_methods = LoginMethod.objects.all()
-
-        provider_map = providers.registry.provider_map
-        methods = []
-        for m in allowed_methods:
-            if m.provider_id == 'saml':
-                continue  # SAML support removed
-            else:
-                p = provider_map[m.provider_id]
-                login_url = p(request).get_login_url(request=self.request)
-                if next_url:
-                    login_url += '?next=' + next_url
-            m.login_url = login_url
-            methods.append(m)
-
+        client_id = client_id or None
+        with metrics.phase('login_methods'):
+            methods = login_methods.get_methods(client_id)
         if len(methods) == 1:
-            return redirect(methods[0].login_url)
+            method = methods[0].with_next(next_url) if next_url else methods[0]
+            return redirect(method.login_url)
+
+        page = self.get_cached_page(client_id, bool(next_url))
+        content = page['content']
+        if next_url:
+            content = content.replace(NEXT_PLACEHOLDER, escape(next_url))
+        etag = hashlib.md5(
+            ('%s:%s' % (page['hash'], next_url or '')).encode('utf8')).hexdigest()
+        last_modified = int(page['rendered_at'])
 
+        response = HttpResponse(content)
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(request, etag=etag, last_modified=last_modified,
+                                        response=response)
+
+    def get_cached_page(self, client_id, has_next):
+        key_parts = (login_methods.get_version(client_id), translation.get_language(), has_next)
+        cache_key = 'login_page:%s' % hashlib.md5(repr(key_parts).encode('utf8')).hexdigest()
+        page = cache.get(cache_key)
+        if page is not None:
+            return page
+
+        methods = login_methods.get_methods(client_id)
+        if has_next:
+            methods = [m.with_next(NEXT_PLACEHOLDER) for m in methods]
         self.login_methods = methods
-        return super(LoginView, self).get(request, *args, **kwargs)
+        with metrics.phase('template'):
+            content = render_to_string(self.template_name, self.get_context_data(),
+                                       request=self.request)
+        page = {
+            'content': content,
+            'hash': hashlib.md5(content.encode('utf8')).hexdigest(),
+            'rendered_at': time.time(),
+        }
+        cache.set(cache_key, page, settings.LOGIN_PAGE_CACHE_TIMEOUT)
+        return page
 
     def get_context_data(self, **kwargs):
         context = super(LoginView, self).get_context_data(**kwargs)
@@ -64,12 +103,30 @@ class LoginView(TemplateView):
         return context
 
 
+class AuthorizationView(oauth2_views.AuthorizationView):
+    """OAuth2 authorization view that records the application for the login."""
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET':
+            login_context.remember_client(request, request.GET.get('client_id', '').strip())
+        return super(AuthorizationView, self).dispatch(request, *args, **kwargs)
+
+    def create_authorization_response(self, request, scopes, credentials, allow):
+        response = super(AuthorizationView, self).create_authorization_response(
+            request, scopes, credentials, allow)
+        if allow:
+            backchannel_logout.remember_client(request.session, credentials['client_id'])
+        return response
+
+
 class LogoutView(TemplateView):
     template_name = 'logout_done.html'
 
     def get(self, *args, **kwargs):
         if self.request.user.is_authenticated():
+            user = self.request.user
+            apps = backchannel_logout.get_applications(self.request.session)
             auth_logout(self.request)
+            backchannel_logout.notify(user, apps)
         url = self.request.GET.get('next')
         if url and re.match(r'http[s]?://', url):
             return redirect(url)
@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import Delivery, Endpoint
+
+
+class EndpointAdmin(admin.ModelAdmin):
+    list_display = ('application', 'url', 'events', 'is_active')
+admin.site.register(Endpoint, EndpointAdmin)
+
+
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ('event', 'endpoint', 'status', 'attempts', 'next_attempt_at', 'delivered_at')
+    list_filter = ('status',)
+    raw_id_fields = ('event',)
+admin.site.register(Delivery, DeliveryAdmin)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class WebhooksConfig(AppConfig):
+    name = 'webhooks'
+    verbose_name = 'Webhooks'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals
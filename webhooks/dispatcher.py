@@ -0,0 +1,224 @@
+"""
+Delivery of queued webhook events.
+
+A Dispatcher runs passes over the endpoints that have deliveries due.
+Each endpoint is handled by one task of a thread pool at a time: the
+task claims a batch of the endpoint's deliveries, POSTs them as one
+request and records the result, until nothing is due or it has sent
+`max_batches` batches. Claims are leases written to the database, so
+several worker processes can run side by side.
+
+Failed deliveries are retried with exponential backoff until
+WEBHOOK_MAX_ATTEMPTS attempts have been made. Requests to an endpoint
+are spaced to stay under its `max_per_second` within each process.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Delivery, Endpoint
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode('utf8'), body, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt, after `attempts` attempts."""
+    delay = min(settings.WEBHOOK_RETRY_MAX_DELAY,
+                settings.WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+class RateLimiter(object):
+    """Spaces out calls per key to at most `rate` per second."""
+    def __init__(self):
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, key, rate):
+        if not rate or rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(key, now))
+            self._next[key] = at + 1.0 / rate
+        if at > now:
+            time.sleep(at - now)
+
+
+def _claimable(now):
+    return Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+
+
+class Dispatcher(object):
+    def __init__(self, concurrency=None, max_batches=10):
+        self.concurrency = concurrency or settings.WEBHOOK_CONCURRENCY
+        self.max_batches = max_batches
+        self.rate_limiter = RateLimiter()
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def claim(self, endpoint):
+        """Lease up to `endpoint.batch_size` due deliveries; return them."""
+        now = timezone.now()
+        return self.lease(endpoint, self.find_claimable(endpoint, now), now)
+
+    def find_claimable(self, endpoint, now):
+        """Return (id, lock_id) of up to `endpoint.batch_size` due deliveries."""
+        due = (Delivery.objects.filter(endpoint=endpoint, status=Delivery.PENDING,
+                                       next_attempt_at__lte=now)
+               .filter(_claimable(now)))
+        return list(due.order_by('id').values_list('id', 'lock_id')[:endpoint.batch_size])
+
+    def lease(self, endpoint, candidates, now):
+        """
+        Lease the `candidates` found by `find_claimable()`; return the
+        deliveries this call got.
+
+        A row is only leased if it is still due and still has the lock id
+        that was read, so when several workers find the same deliveries,
+        each delivery is leased by exactly one of them.
+        """
+        if not candidates:
+            return []
+        by_lock_id = {}
+        for delivery_id, old_lock_id in candidates:
+            by_lock_id.setdefault(old_lock_id, []).append(delivery_id)
+        lock_id = uuid.uuid4().hex
+        locked_until = now + timedelta(seconds=settings.WEBHOOK_LOCK_TIMEOUT)
+        for old_lock_id, ids in by_lock_id.items():
+            (Delivery.objects.filter(id__in=ids, lock_id=old_lock_id, status=Delivery.PENDING,
+                                     next_attempt_at__lte=now)
+             .filter(_claimable(now))
+             .update(lock_id=lock_id, locked_until=locked_until))
+        return list(Delivery.objects.filter(lock_id=lock_id).select_related('event').order_by('id'))
+
+    def send(self, endpoint, deliveries):
+        """POST a batch; return None on success or an error message."""
+        body = json.dumps({'events': [{
+            'id': delivery.event.id,
+            'type': delivery.event.type,
+            'created_at': delivery.event.created_at.isoformat(),
+            'data': json.loads(delivery.event.payload),
+        } for delivery in deliveries]}).encode('utf8')
+        headers = {'Content-Type': 'application/json'}
+        if endpoint.secret:
+            headers[SIGNATURE_HEADER] = sign(endpoint.secret, body)
+
+        self.rate_limiter.wait(endpoint.id, endpoint.max_per_second)
+        try:
+            response = self.session.post(endpoint.url, data=body, headers=headers,
+                                         timeout=settings.WEBHOOK_TIMEOUT)
+        except requests.RequestException as e:
+            return str(e) or e.__class__.__name__
+        if not 200 <= response.status_code < 300:
+            return 'HTTP %d' % response.status_code
+        return None
+
+    def record(self, deliveries, error):
+        """
+        Store the result of sending `deliveries`. Deliveries whose lease
+        expired and was taken over by another worker are left alone.
+        """
+        now = timezone.now()
+        ids = [delivery.id for delivery in deliveries]
+        claimed = Delivery.objects.filter(lock_id=deliveries[0].lock_id)
+        if error is None:
+            claimed.filter(id__in=ids).update(
+                status=Delivery.DELIVERED, delivered_at=now, lock_id='', locked_until=None,
+                last_error='')
+            return
+        # All the deliveries of a batch have been attempted equally often
+        # unless some were added to a failed batch later, so group them.
+        by_attempts = {}
+        for delivery in deliveries:
+            by_attempts.setdefault(delivery.attempts + 1, []).append(delivery.id)
+        for attempts, ids in by_attempts.items():
+            if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                values = dict(status=Delivery.FAILED)
+            else:
+                values = dict(next_attempt_at=now + timedelta(seconds=retry_delay(attempts)))
+            claimed.filter(id__in=ids).update(
+                attempts=attempts, last_error=error, lock_id='', locked_until=None, **values)
+
+    def deliver_endpoint(self, endpoint):
+        """Send due deliveries of `endpoint`; return (delivered, failed) counts."""
+        delivered = failed = 0
+        for i in range(self.max_batches):
+            deliveries = self.claim(endpoint)
+            if not deliveries:
+                break
+            error = self.send(endpoint, deliveries)
+            self.record(deliveries, error)
+            if error is None:
+                delivered += len(deliveries)
+            else:
+                failed += len(deliveries)
+                logger.warning("Delivering %d events to %s failed: %s",
+                               len(deliveries), endpoint.url, error)
+                break  # Back off from this endpoint for this pass
+        return delivered, failed
+
+    def _task(self, endpoint):
+        try:
+            return self.deliver_endpoint(endpoint)
+        except Exception:
+            logger.exception("Delivering events to %s failed", endpoint.url)
+            return 0, 0
+        finally:
+            # Pool threads would otherwise each keep a connection open
+            connection.close()
+
+    def get_due_endpoints(self):
+        now = timezone.now()
+        due = (Delivery.objects.filter(status=Delivery.PENDING, next_attempt_at__lte=now)
+               .filter(_claimable(now)).values('endpoint_id'))
+        return list(Endpoint.objects.filter(is_active=True, id__in=due))
+
+    def run_once(self):
+        """Run one pass; return the total (delivered, failed) counts."""
+        endpoints = self.get_due_endpoints()
+        if not endpoints:
+            return 0, 0
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = list(executor.map(self._task, endpoints))
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+
+    def run_forever(self, poll_interval=1.0):
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            while True:
+                try:
+                    endpoints = self.get_due_endpoints()
+                except Exception:
+                    logger.exception("Looking up endpoints with due deliveries failed")
+                    endpoints = []
+                finally:
+                    connection.close()
+                if endpoints:
+                    list(executor.map(self._task, endpoints))
+                else:
+                    time.sleep(poll_interval)
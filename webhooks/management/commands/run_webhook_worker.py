@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webhooks.dispatcher import Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued webhook events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.WEBHOOK_CONCURRENCY,
+                            help="Number of endpoints delivered to in parallel")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when nothing is due")
+        parser.add_argument('--once', action='store_true',
+                            help="Make one pass over the due deliveries and exit")
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(options['concurrency'])
+        if options['once']:
+            delivered, failed = dispatcher.run_once()
+            self.stdout.write('%d delivered, %d failed' % (delivered, failed))
+        else:
+            dispatcher.run_forever(options['poll_interval'])
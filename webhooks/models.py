@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+EVENT_TYPES = (
+    ('user.logout', 'User logged out'),
+    ('user.updated', 'User created or updated'),
+    ('user.deleted', 'User deleted'),
+)
+
+
+class Endpoint(models.Model):
+    """An URL of an application that events are delivered to."""
+    application = models.ForeignKey(settings.OAUTH2_PROVIDER_APPLICATION_MODEL,
+                                    related_name='webhook_endpoints')
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=100, blank=True,
+                              help_text="Key for the HMAC-SHA256 signature of deliveries")
+    events = models.CharField(max_length=200,
+                              help_text="Comma-separated event types: %s" % ', '.join(
+                                  event_type for event_type, name in EVENT_TYPES))
+    is_active = models.BooleanField(default=True)
+    max_per_second = models.FloatField(default=5, help_text="Maximum requests per second")
+    batch_size = models.PositiveIntegerField(default=50, help_text="Maximum events per request")
+
+    def get_event_types(self):
+        return set(event_type.strip() for event_type in self.events.split(',') if event_type.strip())
+
+    def __str__(self):
+        return "%s: %s" % (self.application, self.url)
+
+
+class Event(models.Model):
+    """An event in the outbox; `payload` is JSON."""
+    id = models.BigAutoField(primary_key=True)
+    type = models.CharField(max_length=50, choices=EVENT_TYPES)
+    payload = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "%s #%s" % (self.type, self.id)
+
+
+class Delivery(models.Model):
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (DELIVERED, 'Delivered'),
+        (FAILED, 'Failed'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    endpoint = models.ForeignKey(Endpoint, related_name='deliveries', on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, related_name='deliveries', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # A worker that has claimed the delivery holds it until locked_until
+    lock_id = models.CharField(max_length=32, blank=True, db_index=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'deliveries'
+        index_together = [('endpoint', 'status', 'next_attempt_at')]
+
+    def __str__(self):
+        return "%s -> %s (%s)" % (self.event, self.endpoint, self.status)
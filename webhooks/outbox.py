@@ -0,0 +1,89 @@
+"""
+Publishing events to the webhook outbox.
+
+Publishing only writes the event and one delivery per subscribed
+endpoint to the database, in the caller's transaction; the HTTP
+requests are made later by the worker in `webhooks.dispatcher`. When no
+endpoint subscribes to an event type, publishing makes no queries.
+
+An event about a user is only delivered to the endpoints of the
+applications that the user has authorized, so that applications do not
+learn about each other's users.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from oauth2_provider.models import AccessToken, RefreshToken
+
+from helsso.registry import Registry
+
+from .models import Delivery, Endpoint, Event
+
+
+class EndpointRegistry(Registry):
+    """(endpoint id, application id) pairs of the active endpoints by event type."""
+    def load(self):
+        subscribers = {}
+        for endpoint in Endpoint.objects.filter(is_active=True):
+            for event_type in endpoint.get_event_types():
+                subscribers.setdefault(event_type, []).append((endpoint.id, endpoint.application_id))
+        return subscribers
+
+    def has_subscribers(self, event_type):
+        return bool(self.get_data().get(event_type))
+
+    def get_subscribers(self, event_type, application_ids):
+        """Return the ids of the endpoints of `application_ids` that take `event_type`."""
+        return [endpoint_id for endpoint_id, application_id in self.get_data().get(event_type, [])
+                if application_id in application_ids]
+
+
+endpoints = EndpointRegistry('webhook_endpoints')
+
+
+def user_payload(user):
+    return {'uuid': str(user.uuid), 'username': user.username}
+
+
+def get_authorized_applications(user_ids):
+    """
+    Return {user id: set of application ids} of the applications that
+    have been issued tokens for each of `user_ids`.
+    """
+    applications = {user_id: set() for user_id in user_ids}
+    for model in (AccessToken, RefreshToken):
+        for user_id, application_id in model.objects.filter(user_id__in=user_ids).values_list(
+                'user_id', 'application_id').distinct():
+            applications[user_id].add(application_id)
+    return applications
+
+
+def publish(event_type, payload, application_ids):
+    """
+    Queue an event for delivery to the endpoints of `application_ids`;
+    return the Event or None if none of them subscribes.
+    """
+    endpoint_ids = endpoints.get_subscribers(event_type, application_ids)
+    if not endpoint_ids:
+        return None
+    event = Event.objects.create(type=event_type, payload=json.dumps(payload, cls=DjangoJSONEncoder))
+    Delivery.objects.bulk_create([Delivery(endpoint_id=endpoint_id, event=event)
+                                  for endpoint_id in endpoint_ids])
+    return event
+
+
+def publish_user_events(event_type, users):
+    """
+    Publish `event_type` for each of `users` to the applications that
+    the user has authorized, looking them up with one query per token
+    model. `users` may be a queryset; it is not evaluated when nobody
+    subscribes to `event_type`.
+    """
+    if not endpoints.has_subscribers(event_type):
+        return
+    users = list(users)
+    if not users:
+        return
+    applications = get_authorized_applications([user.pk for user in users])
+    for user in users:
+        publish(event_type, user_payload(user), applications[user.pk])
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from users import backchannel_logout, changes
+
+from .models import Endpoint
+from .outbox import endpoints, get_authorized_applications, publish, user_payload
+
+
+def publish_user_event(event_type, user, application_ids=None):
+    # Only look up the user's applications when someone subscribes
+    if not endpoints.has_subscribers(event_type):
+        return
+    if application_ids is None:
+        application_ids = get_authorized_applications([user.pk])[user.pk]
+    publish(event_type, user_payload(user), application_ids)
+
+
+@receiver(user_logged_out)
+def publish_logout(sender, request, user, **kwargs):
+    if user is None or not endpoints.has_subscribers('user.logout'):
+        return
+    application_ids = get_authorized_applications([user.pk])[user.pk]
+    application_ids.update(app.pk for app in backchannel_logout.get_session_applications(request.session))
+    publish_user_event('user.logout', user, application_ids)
+
+
+@receiver(post_save, sender=get_user_model())
+def publish_user_save(sender, instance, update_fields=None, **kwargs):
+    if changes.is_relevant_save(update_fields):
+        publish_user_event('user.updated', instance)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def remember_user_applications(sender, instance, **kwargs):
+    # The user's tokens are deleted with the user, before post_delete
+    if endpoints.has_subscribers('user.deleted'):
+        instance._webhook_application_ids = get_authorized_applications([instance.pk])[instance.pk]
+
+
+@receiver(post_delete, sender=get_user_model())
+def publish_user_delete(sender, instance, **kwargs):
+    publish_user_event('user.deleted', instance, getattr(instance, '_webhook_application_ids', set()))
+
+
+@receiver(post_save, sender=Endpoint)
+@receiver(post_delete, sender=Endpoint)
+def invalidate_endpoints(sender, **kwargs):
+    endpoints.invalidate()
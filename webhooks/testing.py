@@ -0,0 +1,59 @@
+"""
+Helpers for exercising webhook delivery without real receiving endpoints.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class WebhookReceiver(object):
+    """
+    Local stand-in for an application's webhook endpoint.
+
+    Every POST is recorded in `requests` as a (path, headers, body) tuple
+    and answered with the next status code of `statuses`, or 200 once
+    they run out, after waiting `delay` seconds. Use `url` as the
+    endpoint URL.
+    """
+    def __init__(self, statuses=(), delay=0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        self.httpd = HTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.url = 'http://127.0.0.1:%d/webhook' % self.httpd.server_port
+        self.thread = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                server.requests.append((self.path, dict(self.headers), body))
+                status = server.statuses.pop(0) if server.statuses else 200
+                time.sleep(server.delay)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def get_events(self):
+        """Return the events of all received requests, in order."""
+        return [event for path, headers, body in self.requests
+                for event in json.loads(body.decode('utf8'))['events']]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users import backchannel_logout
+from users.testing import BenchmarkDataMixin
+
+from .dispatcher import Dispatcher, SIGNATURE_HEADER
+from .models import Delivery, Endpoint
+from .outbox import publish
+from .testing import WebhookReceiver
+
+
+class PublishTests(BenchmarkDataMixin, TestCase):
+    def test_no_subscribers(self):
+        publish('user.updated', {}, {self.data.app.pk})
+        with self.assertNumQueries(0):
+            self.assertIsNone(publish('user.updated', {}, {self.data.app.pk}))
+
+    def test_user_events(self):
+        endpoint = Endpoint.objects.create(application=self.data.app, url='http://localhost/',
+                                           events='user.updated, user.deleted')
+        user = self.data.users[0]
+        user.save(update_fields=['last_login'])
+        user.save()
+        user.delete()
+        self.assertEqual([delivery.event.type for delivery in endpoint.deliveries.order_by('id')],
+                         ['user.updated', 'user.deleted'])
+
+    def test_unrelated_application(self):
+        # The user has no tokens for the target app
+        endpoint = Endpoint.objects.create(application=self.data.target_app, url='http://localhost/',
+                                           events='user.logout, user.updated, user.deleted')
+        user = self.data.users[0]
+        self.client.force_login(user)
+        self.client.get('/logout/')
+        user.save()
+        user.delete()
+        self.assertFalse(endpoint.deliveries.exists())
+
+    def test_logout_to_session_application(self):
+        endpoint = Endpoint.objects.create(application=self.data.target_app, url='http://localhost/',
+                                           events='user.logout')
+        self.client.force_login(self.data.users[0])
+        session = self.client.session
+        session[backchannel_logout.SESSION_KEY] = ['bench-target']
+        session.save()
+        self.client.get('/logout/')
+        self.assertEqual(endpoint.deliveries.get().event.type, 'user.logout')
+
+
+class DispatcherTests(BenchmarkDataMixin, TestCase):
+    user_count = 0
+
+    def setUp(self):
+        super(DispatcherTests, self).setUp()
+        self.receiver = WebhookReceiver().start()
+        self.addCleanup(self.receiver.stop)
+        self.endpoint = Endpoint.objects.create(
+            application=self.data.app, url=self.receiver.url, secret='s3cret',
+            events='user.logout', batch_size=2, max_per_second=0)
+
+    def test_delivery_in_batches(self):
+        for i in range(3):
+            publish('user.logout', {'username': 'user-%d' % i}, {self.data.app.pk})
+        self.assertEqual(Dispatcher().deliver_endpoint(self.endpoint), (3, 0))
+
+        self.assertEqual(len(self.receiver.requests), 2)
+        self.assertEqual([event['data']['username'] for event in self.receiver.get_events()],
+                         ['user-0', 'user-1', 'user-2'])
+        path, headers, body = self.receiver.requests[0]
+        signature = hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+        self.assertEqual(headers[SIGNATURE_HEADER], 'sha256=' + signature)
+        self.assertFalse(Delivery.objects.exclude(status=Delivery.DELIVERED).exists())
+        self.assertEqual(Dispatcher().deliver_endpoint(self.endpoint), (0, 0))
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2)
+    def test_retry(self):
+        self.receiver.statuses = [500, 500, 500]
+        publish('user.logout', {}, {self.data.app.pk})
+        dispatcher = Dispatcher()
+        self.assertEqual(dispatcher.deliver_endpoint(self.endpoint), (0, 1))
+        delivery = Delivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.last_error),
+                         (Delivery.PENDING, 1, 'HTTP 500'))
+        self.assertGreater(delivery.next_attempt_at, timezone.now())
+        # Not due before the backoff delay has passed
+        self.assertEqual(dispatcher.deliver_endpoint(self.endpoint), (0, 0))
+
+        Delivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatcher.deliver_endpoint(self.endpoint), (0, 1))
+        self.assertEqual(Delivery.objects.get().status, Delivery.FAILED)
+        self.assertEqual(len(self.receiver.requests), 2)
+
+    def test_lease_taken_over(self):
+        publish('user.logout', {}, {self.data.app.pk})
+        dispatcher = Dispatcher()
+        deliveries = dispatcher.claim(self.endpoint)
+        # The lease expired and another worker claimed the delivery
+        Delivery.objects.update(lock_id='other')
+        dispatcher.record(deliveries, None)
+        delivery = Delivery.objects.get()
+        self.assertEqual((delivery.status, delivery.lock_id), (Delivery.PENDING, 'other'))
+
+    def test_overlapping_claims(self):
+        for i in range(3):
+            publish('user.logout', {}, {self.data.app.pk})
+        Delivery.objects.update(lock_id='expired', locked_until=timezone.now())
+        first, second = Dispatcher(), Dispatcher()
+        now = timezone.now()
+        # Both workers find the same expired leases before either takes them
+        first_found = first.find_claimable(self.endpoint, now)
+        second_found = second.find_claimable(self.endpoint, now)
+        self.assertEqual(first_found, second_found)
+        first_claimed = first.lease(self.endpoint, first_found, now)
+        self.assertEqual(second.lease(self.endpoint, second_found, now), [])
+
+        # Nor is a delivery leased again after the first worker sent it
+        first.record(first_claimed, None)
+        self.assertEqual(second.lease(self.endpoint, second_found, now), [])
+        owners = Delivery.objects.values_list('lock_id', flat=True)
+        self.assertEqual(sorted(owners), ['', '', 'expired'])
+        self.assertEqual(len(second.claim(self.endpoint)), 1)
+
+    def test_run_forever_survives_errors(self):
+        class Stop(BaseException):
+            pass
+
+        calls = []
+
+        def get_due_endpoints():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError("database went away")
+            raise Stop()
+
+        dispatcher = Dispatcher()
+        dispatcher.get_due_endpoints = get_due_endpoints
+        with self.assertLogs('webhooks.dispatcher', 'ERROR'), self.assertRaises(Stop):
+            dispatcher.run_forever(poll_interval=0)
+        self.assertEqual(len(calls), 2)